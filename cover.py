@@ -6,6 +6,7 @@ import sys
 import json
 from PyQt5 import QtWidgets, QtCore, QtGui
 from cover_engine import render_cover, add_custom_element, delete_element
+from cover_assets import find_assets
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -175,7 +176,7 @@ class CoverGenerator(QtWidgets.QMainWindow):
         
         # 图片路径标签
         self.image_paths[elem_id] = ""
-        path_label = QtWidgets.QLabel("(使用默认图片)")
+        path_label = QtWidgets.QLabel(self.default_image_text(elem_id))
         path_label.setStyleSheet("color: #666; font-style: italic;")
         path_label.setWordWrap(True)
         
@@ -201,6 +202,15 @@ class CoverGenerator(QtWidgets.QMainWindow):
         self.form_layout.addRow(f"{label_text}:", container)
         self.input_widgets[elem_id] = path_label
     
+    def default_image_text(self, elem_id):
+        """未选择图片时的提示，显示默认图片模式匹配到的图片数量"""
+        elem_style = self.style_cfg.get("elements", {}).get(elem_id, {})
+        pattern = elem_style.get("image_pattern", "template/deco_*.png")
+        count = len(find_assets(pattern, BASE_DIR)) if pattern else 0
+        if count:
+            return f"(使用默认图片，共 {count} 张)"
+        return "(使用默认图片)"
+    
     def create_common_parameters(self):
         """创建通用参数"""
         # 添加分隔线
@@ -254,7 +264,7 @@ class CoverGenerator(QtWidgets.QMainWindow):
     def clear_image(self, elem_id):
         """清除选择的图片"""
         self.image_paths[elem_id] = ""
-        self.input_widgets[elem_id].setText("(使用默认图片)")
+        self.input_widgets[elem_id].setText(self.default_image_text(elem_id))
         self.input_widgets[elem_id].setStyleSheet("color: #666; font-style: italic;")
     
     def select_output_file(self):
@@ -0,0 +1,341 @@
+"""
+cover_assets.py - 素材索引与位图缓存
+
+按目录扫描一次 image_pattern 对应的文件，缓存排序后的文件列表和图片元数据，
+目录修改时间变化时增量刷新。渲染引擎、编辑器和主界面共用同一个索引。
+装饰图片解码并缩放到元素尺寸后放入按字节数限制的LRU缓存。
+AssetStore 把素材预先解码为RGBA的 .npy 文件，渲染进程以内存映射方式读取，不再解码。
+"""
+import os
+import glob
+import uuid
+import fnmatch
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+class AssetIndex:
+    """
+    image_pattern 素材索引
+
+    match() 返回与 glob.glob 相同的匹配结果（按路径排序），目录只在首次查询或其
+    修改时间变化后重新列出；info() 返回图片尺寸、模式等元数据，文件未变时不重复读取。
+    """
+
+    def __init__(self):
+        self.scans = 0
+        self.queries = 0
+        # 目录 -> (目录修改时间, {文件名: (修改时间, 大小)})
+        self._dirs: Dict[str, tuple] = {}
+        # 路径 -> ((修改时间, 大小), 元数据)
+        self._meta: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _scan(self, directory: str) -> Dict[str, tuple]:
+        """返回目录中的文件列表，目录未变化时直接使用上次的扫描结果"""
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._dirs.pop(directory, None)
+            return {}
+
+        with self._lock:
+            entry = self._dirs.get(directory)
+            if entry is not None and entry[0] == dir_mtime:
+                return entry[1]
+
+        files = {}
+        with os.scandir(directory) as it:
+            for item in it:
+                try:
+                    if not item.is_file():
+                        continue
+                    st = item.stat()
+                except OSError:
+                    continue
+                files[item.name] = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            self.scans += 1
+            self._dirs[directory] = (dir_mtime, files)
+            # 丢弃已删除或已修改文件的元数据
+            prefix = os.path.join(directory, "")
+            for path in [p for p in self._meta if p.startswith(prefix)]:
+                name = path[len(prefix):]
+                if files.get(name) != self._meta[path][0]:
+                    del self._meta[path]
+        return files
+
+    def match(self, pattern: str) -> List[str]:
+        """返回匹配 pattern 的文件路径列表（已排序）"""
+        with self._lock:
+            self.queries += 1
+
+        if not glob.has_magic(pattern):
+            return [pattern] if os.path.isfile(pattern) else []
+
+        directory, name_pattern = os.path.split(pattern)
+        if glob.has_magic(directory):
+            # 目录部分带通配符时无法按单个目录建索引
+            return sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+
+        files = self._scan(directory or os.curdir)
+        names = fnmatch.filter(files, name_pattern)
+        if not name_pattern.startswith("."):
+            names = [n for n in names if not n.startswith(".")]
+        return sorted(os.path.join(directory, n) for n in names)
+
+    def info(self, path: str) -> Optional[Dict[str, Any]]:
+        """返回图片元数据: width, height, mode, mtime, size；无法读取时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._meta.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+
+        try:
+            # 只读取文件头，不解码像素
+            with Image.open(path) as img:
+                meta = {"width": img.width, "height": img.height, "mode": img.mode,
+                        "mtime": st.st_mtime, "size": st.st_size}
+        except Exception:
+            return None
+
+        with self._lock:
+            self._meta[path] = (stamp, meta)
+        return meta
+
+    def refresh(self, directory: Optional[str] = None):
+        """强制下次查询时重新扫描（不指定目录时清空全部索引）"""
+        with self._lock:
+            if directory is None:
+                self._dirs.clear()
+                self._meta.clear()
+            else:
+                self._dirs.pop(directory, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"queries": self.queries, "scans": self.scans,
+                    "directories": len(self._dirs), "images": len(self._meta)}
+
+
+ASSET_INDEX = AssetIndex()
+
+
+def find_assets(pattern: str, base_dir: Optional[str] = None) -> List[str]:
+    """查找匹配 image_pattern 的素材文件，相对路径基于 base_dir"""
+    if base_dir:
+        pattern = os.path.join(base_dir, pattern)
+    return ASSET_INDEX.match(pattern)
+
+
+def asset_info(path: str) -> Optional[Dict[str, Any]]:
+    """返回素材图片的元数据（尺寸、模式、修改时间、大小）"""
+    return ASSET_INDEX.info(path)
+
+
+def image_view(array: np.ndarray, mode: str = "RGBA") -> Image.Image:
+    """
+    共享 array 内存的PIL图像（H x W x 4 uint8，C连续），不复制像素
+
+    array 可写时返回的图像也可写，ImageDraw 和 alpha_composite 直接修改 array（通过Pillow
+    非公开的 readonly 标记实现，cover_engine.Frame 会检查是否确实共享内存）；
+    mode 为 "RGBX" 时得到同一块内存的无Alpha视图，可直接交给JPEG编码器。
+    """
+    h, w = array.shape[:2]
+    image = Image.frombuffer(mode, (w, h), array, "raw", mode, 0, 1)
+    if array.flags.writeable:
+        image.readonly = 0
+    return image
+
+
+class AssetStore:
+    """
+    预解码素材库
+
+    每个素材解码为 H x W x 4 的RGBA数组，存为 directory 下的 .npy 文件（文件头记录形状和类型），
+    文件名由源文件绝对路径的哈希、修改时间和大小组成，源文件变化后旧条目自然失效。
+    load() 以只读内存映射方式打开，多个进程映射同一文件时共享系统页缓存，不做任何解码。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def _prefix(self, path: str) -> str:
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, digest)
+
+    def entry_path(self, path: str) -> Optional[str]:
+        """返回 path 当前版本对应的库文件路径，源文件不存在时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return f"{self._prefix(path)}-{st.st_mtime_ns}-{st.st_size}.npy"
+
+    def load(self, path: str) -> Optional[np.ndarray]:
+        """返回 path 的RGBA像素（只读内存映射），库中没有当前版本时返回 None"""
+        entry = self.entry_path(path)
+        try:
+            array = np.load(entry, mmap_mode="r") if entry else None
+        except (OSError, ValueError):
+            array = None
+        if array is None or array.ndim != 3 or array.shape[2] != 4 or array.dtype != np.uint8:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return array
+
+    def prepare(self, path: str) -> bool:
+        """
+        解码 path 并写入库中（先写临时文件再重命名），返回是否写入了新条目
+
+        库中已有当前版本时跳过；同一源文件的旧版本条目被删除。
+        """
+        entry = self.entry_path(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        if os.path.exists(entry):
+            return False
+
+        os.makedirs(self.directory, exist_ok=True)
+        with Image.open(path) as img:
+            array = np.asarray(img.convert("RGBA"))
+        temp_path = os.path.join(self.directory, f".{uuid.uuid4().hex[:8]}.tmp.npy")
+        try:
+            np.save(temp_path, array)
+            os.replace(temp_path, entry)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        for old in glob.glob(self._prefix(path) + "-*.npy"):
+            if old != entry:
+                try:
+                    os.unlink(old)
+                except OSError:
+                    pass
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+# 当前进程使用的素材库（由 set_asset_store 设置，未设置时总是解码源文件）
+ASSET_STORE: Optional[AssetStore] = None
+
+
+def set_asset_store(directory: Optional[str]) -> Optional[AssetStore]:
+    """启用（directory 为空时停用）预解码素材库，之后背景和装饰图片缓存未命中时先查库"""
+    global ASSET_STORE
+    ASSET_STORE = AssetStore(directory) if directory else None
+    return ASSET_STORE
+
+
+def load_stored_pixels(path: str) -> Optional[np.ndarray]:
+    """从素材库读取 path 的RGBA像素（只读），未启用素材库或库中没有时返回 None"""
+    store = ASSET_STORE
+    return store.load(path) if store is not None else None
+
+
+class BitmapCache:
+    """
+    已解码并缩放好的元素位图缓存
+
+    按 (源文件路径, 修改时间, 目标尺寸, 重采样方式) 缓存RGBA位图，总字节数超过
+    max_bytes 时淘汰最久未使用的位图。返回的是共享对象，调用方不能原地修改。
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._bitmaps: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._pinned: Dict[tuple, Image.Image] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, size: Tuple[int, int],
+            resample: int = Image.Resampling.LANCZOS) -> Image.Image:
+        mtime = os.stat(path).st_mtime_ns
+        key = (path, mtime, tuple(size), int(resample))
+        with self._lock:
+            bitmap = self._pinned.get(key)
+            if bitmap is not None:
+                self.hits += 1
+                return bitmap
+            bitmap = self._bitmaps.get(key)
+            if bitmap is not None:
+                self._bitmaps.move_to_end(key)
+                self.hits += 1
+                return bitmap
+            self.misses += 1
+
+        pixels = load_stored_pixels(path)
+        if pixels is not None:
+            # 素材库中的只读映射，尺寸相同时直接共享
+            bitmap = image_view(pixels)
+        else:
+            with Image.open(path) as img:
+                bitmap = img.convert("RGBA")
+        if bitmap.size != tuple(size):
+            bitmap = bitmap.resize(tuple(size), resample)
+
+        nbytes = bitmap.width * bitmap.height * 4
+        with self._lock:
+            if key not in self._bitmaps and nbytes <= self.max_bytes:
+                self._bitmaps[key] = bitmap
+                self.bytes += nbytes
+                while self.bytes > self.max_bytes:
+                    _, old = self._bitmaps.popitem(last=False)
+                    self.bytes -= old.width * old.height * 4
+        return bitmap
+
+    def put(self, path: str, size: Tuple[int, int], bitmap: Image.Image, mtime_ns: int,
+            resample: int = Image.Resampling.LANCZOS):
+        """
+        放入已缩放好的只读位图（如共享内存中的视图），mtime_ns 为生成时源文件的修改时间
+
+        该位图不计入 max_bytes（内存不属于本进程），也不会被淘汰。
+        """
+        key = (path, mtime_ns, tuple(size), int(resample))
+        with self._lock:
+            self._pinned[key] = bitmap
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._bitmaps),
+                    "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._bitmaps.clear()
+            self._pinned.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+BITMAP_CACHE = BitmapCache()
+
+
+def load_element_bitmap(path: str, size: Tuple[int, int],
+                        resample: int = Image.Resampling.LANCZOS) -> Image.Image:
+    """返回缩放到 size 的RGBA位图（缓存共享对象，不要直接修改）"""
+    return BITMAP_CACHE.get(path, size, resample)
@@ -0,0 +1,122 @@
+"""
+cover_async.py - asyncio 渲染接口
+
+渲染在执行器（默认进程池）中进行，不阻塞事件循环；信号量限制同时进行的渲染数，
+取消尚未开始的任务会把它从执行器中撤下。参数和返回值与 render_cover 相同。
+
+用法:
+    async with AsyncCoverRenderer(max_concurrency=4) as renderer:
+        path = await renderer.render({"title": "标题", "episode": 3})
+        async for result in renderer.as_completed(jobs):
+            print(result["index"], result["status"])
+"""
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterable, Optional
+
+import cover_engine
+
+
+def _call_worker(method: str, *args):
+    """在工作进程中调用渲染器方法"""
+    return getattr(cover_engine.worker_renderer(), method)(*args)
+
+
+class AsyncCoverRenderer:
+    """
+    异步封面渲染器
+
+    max_concurrency: 同时提交到执行器的渲染数上限
+    processes: True 时使用进程池（每个进程加载一次模板），False 时在线程池中共用一个渲染器
+    workers: 执行器的进程/线程数，默认与 max_concurrency 相同
+    """
+
+    def __init__(self, max_concurrency: int = 4, processes: bool = True,
+                 workers: Optional[int] = None, layout_path: Optional[str] = None,
+                 style_path: Optional[str] = None):
+        layout_path = layout_path or cover_engine.LAYOUT_PATH
+        style_path = style_path or cover_engine.STYLE_PATH
+        workers = workers or max_concurrency
+
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._renderer: Optional[cover_engine.CoverRenderer] = None
+        if processes:
+            self._executor: Executor = ProcessPoolExecutor(
+                workers, initializer=cover_engine.init_worker, initargs=(layout_path, style_path))
+        else:
+            self._renderer = cover_engine.CoverRenderer(layout_path, style_path)
+            self._executor = ThreadPoolExecutor(workers, thread_name_prefix="cover-render")
+
+    async def _run(self, method: str, *args):
+        """占用一个并发名额，在执行器中调用渲染器方法"""
+        await self._semaphore.acquire()
+        try:
+            if self._renderer is not None:
+                future = self._executor.submit(getattr(self._renderer, method), *args)
+            else:
+                future = self._executor.submit(_call_worker, method, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+        # 名额在执行器中的任务结束后才释放：已开始执行的任务被取消时仍占用CPU
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._semaphore.release))
+        # 等待被取消时，wrap_future 会同时取消尚未开始的执行器任务
+        return await asyncio.wrap_future(future)
+
+    async def render(self, params: Dict[str, Any]) -> str:
+        """渲染单张封面并写文件，返回输出路径（同 render_cover）"""
+        return await self._run("render", params)
+
+    async def render_data(self, params: Dict[str, Any], kind: str = "image", fmt: str = "PNG",
+                          options: Optional[Dict[str, Any]] = None):
+        """在内存中渲染封面（同 CoverRenderer.render_data）"""
+        return await self._run("render_data", params, kind, fmt, options)
+
+    async def _render_job(self, index: int, params: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = {"index": index, "status": "ok", "output_path": None, "error": None}
+        try:
+            result["output_path"] = await self.render(params)
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["elapsed"] = loop.time() - start
+        return result
+
+    async def as_completed(self, jobs: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        批量渲染，按完成顺序逐个产出结果（字段同 CoverRenderer.render_covers）
+
+        单个任务失败不会中断整批；提前退出 async for 时取消剩余任务。
+        """
+        tasks = [asyncio.ensure_future(self._render_job(index, params))
+                 for index, params in enumerate(jobs)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close(self):
+        """等待执行器中的任务结束并关闭执行器"""
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._executor.shutdown, wait=True, cancel_futures=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def render_cover_async(params: Dict[str, Any]) -> str:
+    """render_cover 的异步版本：在默认线程池中渲染，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, cover_engine.render_cover, params)
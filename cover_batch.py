@@ -0,0 +1,352 @@
+"""
+cover_batch.py - 无界面批量渲染命令行
+
+从 CSV/JSONL 清单读取任务，分发到进程池并行渲染，每个工作进程只预加载一次模板。
+
+用法:
+    python cover_batch.py jobs.csv -o results.jsonl -j 32
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from typing import Dict, Any, List, Optional, Iterator, Union
+
+import cover_engine
+import cover_shared
+from cover_assets import set_asset_store
+from cover_cache import RenderCache, link_outputs, format_stats
+from cover_trace import TraceWriter, aggregate, format_summary
+
+# 清单中按整数解析的字段
+INT_FIELDS = ("episode", "seed")
+
+RESULT_FIELDS = ["index", "status", "output_path", "error", "elapsed", "cached", "pid",
+                 "font_cache_hits", "font_cache_misses", "mem_peak_bytes", "rss_peak_bytes"]
+
+# 工作进程中各任务的记录方式（由 _init_worker 设置）
+_worker_trace = False
+
+
+class BadRow:
+    """清单中无法作为任务的行（不是有效的JSON或不是对象），在工作进程中报告为该任务的错误"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+    def __repr__(self):
+        return f"BadRow({self.message!r})"
+
+
+# 清单中的一行：列名/键 -> 值，或 BadRow
+ManifestRow = Union[Dict[str, Any], BadRow]
+
+
+def _normalize_job(row: ManifestRow) -> Dict[str, Any]:
+    """整理清单中的一行：去掉空值，集数和种子转为整数"""
+    if isinstance(row, BadRow):
+        raise ValueError(row.message)
+    if not isinstance(row, dict):
+        raise ValueError(f"任务必须是JSON对象，而不是 {type(row).__name__}")
+    params = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        key = key.strip()
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "":
+                continue
+        if value is None:
+            continue
+        if key in INT_FIELDS:
+            value = int(value)
+        params[key] = value
+    return params
+
+
+def read_manifest(path: str) -> List[ManifestRow]:
+    """
+    读取任务清单，返回原始行（在工作进程中再整理，格式错误的行只影响该任务）
+
+    .csv: 首行为列名，如 title,episode,tagline,seed,output_path，其余列按元素ID传入
+    .jsonl: 每行一个JSON对象，键名与 render_cover 的 params 相同；无效的JSON或不是对象的行
+            读为 BadRow，只使该任务失败
+    """
+    jobs = []
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            jobs.extend(csv.DictReader(f))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    row = BadRow(f"{path}:{line_no} 不是有效的JSON: {e}")
+                else:
+                    if not isinstance(row, dict):
+                        row = BadRow(f"{path}:{line_no} 不是JSON对象")
+                jobs.append(row)
+    return jobs
+
+
+class ResultWriter:
+    """按扩展名将结果写为 JSONL 或 CSV"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._csv = None
+        if self.is_csv:
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, result: Dict[str, Any]):
+        # 计时记录单独写入 --trace 文件
+        result = {k: v for k, v in result.items() if k != "trace"}
+        if self._csv is not None:
+            self._csv.writerow(result)
+        else:
+            self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _init_worker(layout_path: str, style_path: str, trace=False, asset_store: Optional[str] = None,
+                 shared: Optional[Dict[str, Any]] = None):
+    """工作进程初始化：创建渲染器（见 cover_engine.init_worker），trace 为各任务的记录方式"""
+    global _worker_trace
+    cover_engine.init_worker(layout_path, style_path, asset_store, shared)
+    _worker_trace = trace
+
+
+def _run_job(task) -> Dict[str, Any]:
+    """在工作进程中渲染一个任务"""
+    index, row = task
+    try:
+        params = _normalize_job(row)
+    except (ValueError, TypeError) as e:
+        result = {"index": index, "status": "error", "output_path": None,
+                  "error": f"清单格式错误: {e}", "elapsed": 0.0}
+    else:
+        result = cover_engine.worker_renderer().render_job(params, index, _worker_trace)
+    font_stats = cover_engine.font_cache_stats()
+    result["pid"] = os.getpid()
+    result["font_cache_hits"] = font_stats["hits"]
+    result["font_cache_misses"] = font_stats["misses"]
+    trace = result.get("trace")
+    if trace and "rss_peak_bytes" in trace:
+        result["mem_peak_bytes"] = trace["mem_peak_bytes"]
+        result["rss_peak_bytes"] = trace["rss_peak_bytes"]
+    return result
+
+
+def _plan_cached(jobs: List[ManifestRow], cache: RenderCache, renderer: cover_engine.CoverRenderer):
+    """
+    在父进程中查询缓存并合并重复任务
+
+    产出 ("hit", 结果) 表示已从缓存恢复；("render", 序号, 行, 组) 表示需要渲染，
+    组为 (键, 输出路径, [(重复任务序号, 输出路径)])，键为 None 时不缓存。
+    """
+    primaries: Dict[str, tuple] = {}
+    for index, row in enumerate(jobs):
+        start = time.perf_counter()
+        key = paths = None
+        try:
+            params = _normalize_job(row)
+            key = cache.key(renderer, params)
+            if key is not None:
+                paths = renderer.output_paths(params)
+        except Exception:
+            # 格式错误等由工作进程报告
+            key = None
+        if key is None:
+            cache.uncacheable += 1
+            yield "render", index, row, None
+            continue
+
+        group = primaries.get(key)
+        if group is not None:
+            group[2].append((index, paths))
+            cache.deduplicated += 1
+            continue
+        try:
+            hit = cache.restore(key, paths)
+        except OSError:
+            hit = False
+        if hit:
+            yield "hit", {"index": index, "status": "ok", "output_path": paths[0], "error": None,
+                          "elapsed": time.perf_counter() - start, "cached": True, "pid": os.getpid()}
+            continue
+        group = primaries[key] = (key, paths, [])
+        yield "render", index, row, group
+
+
+def _finish_group(result: Dict[str, Any], group: tuple, cache: RenderCache) -> List[Dict[str, Any]]:
+    """渲染完成后写入缓存，并把输出链接给合并掉的重复任务，返回这些任务的结果"""
+    key, paths, duplicates = group
+    if result["status"] == "ok":
+        try:
+            cache.store(key, paths)
+        except OSError:
+            pass
+    results = []
+    for index, dup_paths in duplicates:
+        start = time.perf_counter()
+        dup = {"index": index, "status": result["status"], "output_path": None,
+               "error": result["error"], "cached": True, "pid": os.getpid()}
+        if result["status"] == "ok":
+            try:
+                link_outputs(paths, dup_paths, cache.link)
+                dup["output_path"] = dup_paths[0]
+            except OSError as e:
+                dup["status"] = "error"
+                dup["error"] = f"{type(e).__name__}: {e}"
+        dup["elapsed"] = time.perf_counter() - start
+        results.append(dup)
+    return results
+
+
+def run_batch(jobs: List[ManifestRow], results_path: Optional[str] = None,
+              workers: Optional[int] = None, layout_path: Optional[str] = None,
+              style_path: Optional[str] = None, chunksize: int = 1,
+              trace_path: Optional[str] = None, memory: bool = False,
+              asset_store: Optional[str] = None, shared_memory: bool = False,
+              cache: Optional[RenderCache] = None) -> Iterator[Dict[str, Any]]:
+    """
+    用进程池渲染任务列表，按完成顺序逐个产出结果
+
+    results_path 不为空时同时把结果写入文件；trace_path 不为空时记录每个任务各阶段的耗时，
+    写为JSON行，结果中也带有 "trace"。memory 为 True 时同时记录各阶段的内存峰值、
+    分配位置和工作进程RSS峰值（开销较大，只用于分析）。asset_store 为素材库目录时
+    先把模板素材预解码写入库中，工作进程映射库文件而不解码图片。shared_memory 为 True 时
+    父进程把背景、暗角蒙版和装饰图片放入共享内存，所有工作进程共用一份。
+    cache 不为空时先查询渲染缓存，命中的任务直接链接上次的输出，相同的任务只渲染一次；
+    结果中 "cached" 表示输出来自缓存或同批的相同任务。
+    """
+    layout_path = layout_path or cover_engine.LAYOUT_PATH
+    style_path = style_path or cover_engine.STYLE_PATH
+    workers = workers or os.cpu_count() or 1
+    if asset_store:
+        cover_engine.prepare_asset_store(asset_store, layout_path, style_path)
+        set_asset_store(asset_store)
+
+    writer = ResultWriter(results_path) if results_path else None
+    trace_writer = TraceWriter(trace_path) if trace_path else None
+
+    def emit(result):
+        if writer:
+            writer.write(result)
+        if trace_writer:
+            trace_writer.write(result.get("trace"), pid=result["pid"])
+        return result
+
+    tasks = list(enumerate(jobs))
+    groups: Dict[int, tuple] = {}
+    shared = None
+    try:
+        if cache is not None:
+            tasks = []
+            for item in _plan_cached(jobs, cache, cover_engine.CoverRenderer(layout_path, style_path)):
+                if item[0] == "hit":
+                    yield emit(item[1])
+                    continue
+                _, index, row, group = item
+                tasks.append((index, row))
+                if group is not None:
+                    groups[index] = group
+        if not tasks:
+            return
+
+        if shared_memory:
+            shared = cover_shared.SharedAssets(layout_path, style_path)
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(layout_path, style_path,
+                                            "memory" if memory else bool(trace_path),
+                                            asset_store, shared.spec if shared else None)) as pool:
+            for result in pool.imap_unordered(_run_job, tasks, chunksize):
+                result["cached"] = False
+                yield emit(result)
+                group = groups.pop(result["index"], None)
+                if group is not None:
+                    for duplicate in _finish_group(result, group, cache):
+                        yield emit(duplicate)
+    finally:
+        # Pool 的 with 块退出时工作进程已终止，此后才能删除共享内存
+        if shared:
+            shared.close()
+        if writer:
+            writer.close()
+        if trace_writer:
+            trace_writer.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="批量渲染封面（无界面）")
+    parser.add_argument("manifest", help="任务清单，.csv 或 .jsonl")
+    parser.add_argument("-o", "--results", default="results.jsonl",
+                        help="结果文件，.jsonl 或 .csv（默认 results.jsonl）")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="工作进程数（默认CPU核数）")
+    parser.add_argument("--chunksize", type=int, default=1, help="每次分发给工作进程的任务数")
+    parser.add_argument("--layout", default=None, help="布局配置路径（默认 layout.json）")
+    parser.add_argument("--style", default=None, help="样式配置路径（默认 style.json）")
+    parser.add_argument("--trace", default=None,
+                        help="记录各阶段耗时并写入该JSONL文件，结束时输出各阶段的 p50/p95/p99")
+    parser.add_argument("--memory", action="store_true",
+                        help="同时记录各阶段内存峰值和工作进程RSS峰值（较慢，用于确定进程数）")
+    parser.add_argument("--asset-store", default=None,
+                        help="素材库目录：预先解码模板素材，工作进程以内存映射方式共享")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="背景、暗角蒙版和装饰图片放入共享内存，工作进程共用一份")
+    parser.add_argument("--cache", default=None,
+                        help="渲染缓存目录：参数、模板和素材都未变化的封面直接链接上次的输出")
+    parser.add_argument("--cache-size", type=int, default=1024, help="渲染缓存大小上限（MiB，默认 1024）")
+    args = parser.parse_args(argv)
+
+    jobs = read_manifest(args.manifest)
+    if not jobs:
+        print("清单为空")
+        return 0
+
+    cache = RenderCache(args.cache, args.cache_size * 2 ** 20) if args.cache else None
+    start = time.perf_counter()
+    ok = failed = 0
+    traces = []
+    for result in run_batch(jobs, args.results, args.workers, args.layout, args.style,
+                            args.chunksize, args.trace, args.memory, args.asset_store,
+                            args.shared_memory, cache):
+        if "trace" in result:
+            traces.append(result["trace"])
+        if result["status"] == "ok":
+            ok += 1
+        else:
+            failed += 1
+            print(f"任务 {result['index']} 失败: {result['error']}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    if traces:
+        print(format_summary(aggregate(traces)))
+    if args.memory and traces:
+        print("\n内存峰值（MiB，tracemalloc）")
+        print(format_summary(aggregate(traces, "mem_peak_bytes", "mem_peak_bytes"), 2 ** 20))
+        rss_peak = max(t["rss_peak_bytes"] for t in traces)
+        print(f"工作进程RSS峰值: {rss_peak / 2 ** 20:.1f} MiB")
+    if cache is not None:
+        print(format_stats(cache.stats()))
+    print(f"完成 {ok} 个，失败 {failed} 个，用时 {elapsed:.1f}s，结果已写入 {args.results}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+cover_bench.py - cover_engine 热点函数基准测试
+
+在临时目录中生成背景、装饰图片和模板（字体使用项目 fonts/ 目录或系统字体），
+分别计时滤镜、文本（有无描边/阴影）、徽章、图片元素、随机变化和完整渲染，
+并把元素数量从 1 增加到数百测试伸缩性。结果为JSON，可与保存的基线比较。
+--memory 时另外记录每项一次调用的 tracemalloc 峰值和RSS增量。
+每项都记录平均每次调用的整帧像素复制次数（frame_copies）。
+
+用法:
+    python cover_bench.py -o baseline.json
+    python cover_bench.py --compare baseline.json --threshold 0.1
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from typing import Dict, Any, List, Optional, Callable
+
+import cv2
+import numpy as np
+import PIL
+from PIL import Image
+
+import cover_engine
+from cover_trace import RssSampler, current_rss, frame_copies
+
+# 优先使用的中文字体，找不到时退回任意可用字体
+PREFERRED_FONTS = ("msyhbd.ttc", "msyh.ttc", "notosanscjk", "sourcehansans", "wqy", "simhei",
+                   "pingfang", "dejavusans-bold.ttf", "dejavusans.ttf")
+FONT_EXTENSIONS = (".ttf", ".ttc", ".otf")
+CJK_HINTS = ("msyh", "cjk", "sourcehan", "wqy", "simhei", "pingfang")
+
+SCALE_COUNTS = (1, 10, 50, 100, 200, 400)
+
+# 内存峰值低于该值的项不参与内存退化判断（噪声较大）
+MIN_COMPARE_BYTES = 64 * 1024
+
+
+def find_font() -> tuple:
+    """返回 (字体目录, 字体文件名)，依次查找项目 fonts/ 目录和系统字体目录"""
+    dirs = [os.path.join(cover_engine.BASE_DIR, "fonts"),
+            os.path.join(os.environ.get("WINDIR", "C:/Windows"), "Fonts"),
+            "/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts"),
+            "/Library/Fonts", "/System/Library/Fonts"]
+    candidates = []
+    for root_dir in dirs:
+        if not os.path.isdir(root_dir):
+            continue
+        for root, _, files in os.walk(root_dir):
+            candidates.extend(os.path.join(root, f) for f in files
+                              if f.lower().endswith(FONT_EXTENSIONS))
+    if not candidates:
+        raise RuntimeError("找不到可用的字体文件")
+
+    def rank(path):
+        name = os.path.basename(path).lower()
+        for i, prefix in enumerate(PREFERRED_FONTS):
+            if name.startswith(prefix):
+                return i
+        return len(PREFERRED_FONTS)
+
+    path = min(candidates, key=rank)
+    return os.path.dirname(path), os.path.basename(path)
+
+
+def make_assets(workdir: str, width: int, height: int, seed: int = 0):
+    """生成背景图和三张半透明装饰图"""
+    rng = np.random.RandomState(seed)
+    os.makedirs(os.path.join(workdir, "template"), exist_ok=True)
+
+    # 渐变加噪点，避免纯色背景让编码过快
+    gx = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    gy = np.linspace(0, 255, height, dtype=np.float32)[:, None, None]
+    base = np.concatenate([np.broadcast_to(gx, (height, width, 1)),
+                           np.broadcast_to(gy, (height, width, 1)),
+                           np.broadcast_to((gx + gy) / 2, (height, width, 1))], axis=2)
+    noise = rng.randint(-20, 21, (height, width, 3))
+    bg = np.clip(base + noise, 0, 255).astype(np.uint8)
+    Image.fromarray(bg, "RGB").save(os.path.join(workdir, "template", "bg.png"))
+
+    for i in range(3):
+        deco = rng.randint(0, 256, (240, 320, 4)).astype(np.uint8)
+        deco[..., 3] = cv2.GaussianBlur(deco[..., 3], (31, 31), 0)
+        Image.fromarray(deco, "RGBA").save(os.path.join(workdir, "template", f"deco_{i}.png"))
+
+
+def text_style(font_file: str, stroke: bool = True, shadow: bool = True) -> Dict[str, Any]:
+    return {
+        "font_file": font_file, "base_size": 96, "min_size": 48, "max_size": 120,
+        "fill_color": "#FFFFFF", "stroke_color": "#000000", "stroke_width": 4 if stroke else 0,
+        "shadow": {"enabled": shadow, "offset_x": 4, "offset_y": 4, "blur_radius": 6,
+                   "color": "#00000080"},
+    }
+
+
+def badge_style(font_file: str) -> Dict[str, Any]:
+    return {"font_file": font_file, "size": 48, "badge_bg_color": "#FFCC00",
+            "badge_text_color": "#000000", "corner_radius": 24, "padding_x": 24,
+            "padding_y": 18, "format": "EP {ep:02d}"}
+
+
+def image_style(workdir: str) -> Dict[str, Any]:
+    return {"image_pattern": os.path.join(workdir, "template", "deco_*.png"), "opacity": 0.9}
+
+
+JITTER = {"jitter_x": [-3, 3], "jitter_y": [-3, 3]}
+
+
+def make_template(workdir: str, font_dir: str, font_file: str, width: int, height: int,
+                  count: Optional[int] = None) -> tuple:
+    """
+    生成布局和样式配置
+
+    count 为空时生成标准模板（标题、集数徽章、副标题、装饰图）；否则生成 count 个
+    文本/徽章/图片轮换的元素，排成网格，每个都有随机偏移（不会被预合成）。
+    """
+    style = {"global": {
+        "font_dir": font_dir,
+        "template_bg": os.path.join(workdir, "template", "bg.png"),
+        "opencv_filters": {"enable": True, "contrast_range": [0.98, 1.05],
+                           "brightness_range": [-8, 8], "vignette_strength": 0.15},
+    }, "elements": {}}
+    elements = []
+
+    if count is None:
+        specs = [("title_main", "text", (120, 120, 1200, 240)),
+                 ("episode_badge", "badge", (120, 420, 320, 120)),
+                 ("tagline", "text", (120, 600, 1000, 160)),
+                 ("deco_main", "image", (1400, 600, 400, 300))]
+    else:
+        cols = max(1, int(np.ceil(np.sqrt(count * width / height))))
+        cell_w, cell_h = width // cols, height // int(np.ceil(count / cols))
+        kinds = ("text", "badge", "image")
+        specs = [(f"bench_{i}", kinds[i % 3],
+                  ((i % cols) * cell_w, (i // cols) * cell_h, max(8, cell_w - 4), max(8, cell_h - 4)))
+                 for i in range(count)]
+
+    for elem_id, kind, (x, y, w, h) in specs:
+        elements.append({"id": elem_id, "type": kind, "x": x, "y": y, "width": w, "height": h,
+                         "align": "left", "enabled": True})
+        if kind == "text":
+            cfg = text_style(font_file)
+        elif kind == "badge":
+            cfg = badge_style(font_file)
+        else:
+            cfg = image_style(workdir)
+        if count is not None:
+            cfg["variation"] = dict(JITTER)
+        style["elements"][elem_id] = cfg
+
+    layout = {"canvas": {"width": width, "height": height}, "elements": elements}
+    return layout, style
+
+
+def sample_params(layout: Dict[str, Any], cjk: bool, seed: int = 1) -> Dict[str, Any]:
+    title, tagline, label = (("示例标题：第一集", "示例副标题", "标签") if cjk
+                             else ("Sample Title: Episode", "Sample tagline", "Label"))
+    params = {"title": title, "episode": 3, "tagline": tagline, "seed": seed}
+    for elem in layout["elements"]:
+        if elem["id"].startswith("bench_") and elem["type"] != "image":
+            params[elem["id"]] = label
+    return params
+
+
+def measure(fn: Callable, setup: Optional[Callable] = None, repeat: int = 20,
+            number: int = 1) -> Dict[str, Any]:
+    """
+    计时 fn，返回每次调用的毫秒统计和平均整帧复制次数
+
+    setup 的返回值作为 fn 的参数，其耗时和复制不计入；先预热一次。
+    """
+    arg = setup() if setup else None
+    fn(arg) if setup else fn()
+
+    samples = []
+    copies = 0
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        copies -= frame_copies()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(arg) if setup else fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+        copies += frame_copies()
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": min(samples),
+        "mean_ms": statistics.fmean(samples),
+        "stdev_ms": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "frame_copies": copies / (repeat * number),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def measure_memory(fn: Callable, setup: Optional[Callable] = None) -> Dict[str, int]:
+    """
+    调用一次 fn，返回 tracemalloc 峰值（相对调用前）和RSS峰值增量
+
+    缓存应已在计时阶段预热，这里只反映单次调用的临时分配。
+    """
+    arg = setup() if setup else None
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    sampler = RssSampler(0.001)
+    try:
+        rss_start = current_rss() or 0
+        sampler.take_peak()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(arg) if setup else fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        rss_peak = sampler.take_peak()
+    finally:
+        sampler.stop()
+        if started:
+            tracemalloc.stop()
+    return {"peak_bytes": peak - base, "rss_delta_bytes": max(0, rss_peak - rss_start)}
+
+
+def run_benchmarks(width: int = 1920, height: int = 1080, repeat: int = 20,
+                   scale_counts=SCALE_COUNTS, only: Optional[List[str]] = None,
+                   memory: bool = False) -> Dict[str, Any]:
+    """生成测试素材并运行全部基准，返回结果字典"""
+    font_dir, font_file = find_font()
+    cjk = any(hint in font_file.lower() for hint in CJK_HINTS)
+    workdir = tempfile.mkdtemp(prefix="cover_bench_")
+    results: Dict[str, Any] = {}
+
+    def bench(name, *args, **kwargs):
+        if only and not any(name.startswith(prefix) for prefix in only):
+            return
+        results[name] = measure(*args, **kwargs)
+        line = f"{name:<32} {results[name]['median_ms']:10.3f} ms {results[name]['frame_copies']:5.1f} 次复制"
+        if memory:
+            results[name].update(measure_memory(args[0], kwargs.get("setup")))
+            line += f" {results[name]['peak_bytes'] / 2 ** 20:10.2f} MiB"
+        print(line, file=sys.stderr)
+
+    try:
+        make_assets(workdir, width, height)
+        layout, style = make_template(workdir, font_dir, font_file, width, height)
+        params = sample_params(layout, cjk)
+        bg = cover_engine.load_background(style["global"]["template_bg"])
+        box = {"x": 120, "y": 120, "width": 1200, "height": 240}
+        badge_box = {"x": 120, "y": 420, "width": 320, "height": 120}
+        image_box = {"x": 1400, "y": 600, "width": 400, "height": 300}
+
+        def canvas():
+            return cover_engine.CanvasDraw(bg.copy(), "RGBA")
+
+        np_rng = np.random.RandomState(0)
+        bench("apply_opencv_filters", lambda img: cover_engine.apply_opencv_filters(
+            img, style["global"]["opencv_filters"], np_rng), setup=bg.copy, repeat=repeat)
+
+        for name, stroke, shadow in (("plain", False, False), ("stroke", True, False),
+                                     ("shadow", False, True), ("stroke_shadow", True, True)):
+            cfg = text_style(font_file, stroke, shadow)
+            bench(f"draw_text_with_style.{name}", lambda draw, cfg=cfg: cover_engine.draw_text_with_style(
+                draw, box, params["title"], cfg, font_dir), setup=canvas, repeat=repeat)
+
+        bench("draw_badge", lambda draw: cover_engine.draw_badge(
+            draw, badge_box, "EP 03", badge_style(font_file), font_dir), setup=canvas, repeat=repeat)
+
+        rng = random.Random(0)
+        bench("draw_image_element", lambda draw: cover_engine.draw_image_element(
+            draw, image_box, image_style(workdir), workdir, rng=rng), setup=canvas, repeat=repeat)
+
+        variation_cfg = {"jitter_x": [-3, 3], "jitter_y": [-3, 3], "color_adjust": [-5, 5],
+                         "opacity_range": [0.9, 1.0]}
+        bench("get_random_variation", lambda: cover_engine.get_random_variation(
+            variation_cfg, None, rng), repeat=repeat, number=1000)
+
+        renderer = cover_engine.CoverRenderer(layout=layout, style=style)
+        out_path = os.path.join(workdir, "cover.jpg")
+        bench("render_image", lambda: renderer.render_image(params), repeat=repeat)
+        bench("renderer.render", lambda: renderer.render(dict(params, output_path=out_path)),
+              repeat=repeat)
+
+        # render_cover 每次调用都读取并编译 LAYOUT_PATH/STYLE_PATH，这里指向临时模板
+        layout_path = os.path.join(workdir, "layout.json")
+        style_path = os.path.join(workdir, "style.json")
+        for path, config in ((layout_path, layout), (style_path, style)):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(config, f, ensure_ascii=False)
+        saved_paths = cover_engine.LAYOUT_PATH, cover_engine.STYLE_PATH
+        cover_engine.LAYOUT_PATH, cover_engine.STYLE_PATH = layout_path, style_path
+        try:
+            bench("render_cover", lambda: cover_engine.render_cover(dict(params, output_path=out_path)),
+                  repeat=repeat)
+        finally:
+            cover_engine.LAYOUT_PATH, cover_engine.STYLE_PATH = saved_paths
+
+        for count in scale_counts:
+            scale_layout, scale_style = make_template(workdir, font_dir, font_file, width, height, count)
+            scale_renderer = cover_engine.CoverRenderer(layout=scale_layout, style=scale_style)
+            scale_params = sample_params(scale_layout, cjk)
+            bench(f"scale.elements_{count}", lambda r=scale_renderer, p=scale_params: r.render_image(p),
+                  repeat=max(3, repeat // 4))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pillow": PIL.__version__,
+            "opencv": cv2.__version__,
+            "font": font_file,
+            "canvas": [width, height],
+            "repeat": repeat,
+            "memory": memory,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    与基线比较，返回每项的变化；ratio 超过 1 + threshold 的标记为退化
+
+    耗时比较中位数（metric="time"）；两边都有内存数据时另外比较 tracemalloc 峰值（metric="memory"）；
+    两边都有整帧复制次数时，次数增加即为退化（metric="copies"）。
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] > 0 else float("inf")
+        rows.append({"name": name, "metric": "time", "baseline": base["median_ms"],
+                     "current": result["median_ms"], "ratio": ratio, "regression": ratio > 1 + threshold})
+        if "peak_bytes" in result and "peak_bytes" in base:
+            ratio = result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] > 0 else float("inf")
+            rows.append({"name": name, "metric": "memory", "baseline": base["peak_bytes"],
+                         "current": result["peak_bytes"], "ratio": ratio,
+                         "regression": (ratio > 1 + threshold
+                                        and result["peak_bytes"] >= MIN_COMPARE_BYTES)})
+        if "frame_copies" in result and "frame_copies" in base:
+            ratio = (result["frame_copies"] / base["frame_copies"] if base["frame_copies"] > 0
+                     else (1.0 if result["frame_copies"] == 0 else float("inf")))
+            rows.append({"name": name, "metric": "copies", "baseline": base["frame_copies"],
+                         "current": result["frame_copies"], "ratio": ratio,
+                         "regression": result["frame_copies"] > base["frame_copies"]})
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="cover_engine 基准测试")
+    parser.add_argument("-o", "--output", default=None, help="结果JSON路径（默认输出到标准输出）")
+    parser.add_argument("--compare", default=None, help="与之比较的基线JSON")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="中位数变慢超过该比例时视为退化（默认 0.10）")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数")
+    parser.add_argument("--size", default="1920x1080", help="画布尺寸（默认 1920x1080）")
+    parser.add_argument("--scale", default=",".join(map(str, SCALE_COUNTS)),
+                        help="伸缩测试的元素数量，逗号分隔")
+    parser.add_argument("--only", action="append", default=None, help="只运行名称以此开头的项，可重复")
+    parser.add_argument("--memory", action="store_true", help="同时记录每项的内存峰值")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    scale_counts = [int(v) for v in args.scale.split(",") if v.strip()]
+    report = run_benchmarks(width, height, args.repeat, scale_counts, args.only, args.memory)
+
+    status = 0
+    if args.compare:
+        baseline = cover_engine.load_json(args.compare)
+        rows = compare(report, baseline, args.threshold)
+        report["comparison"] = {"baseline": args.compare, "threshold": args.threshold, "rows": rows}
+        for row in rows:
+            flag = "  退化" if row["regression"] else ""
+            if row["metric"] == "time":
+                values = f"{row['baseline']:10.3f} -> {row['current']:10.3f} ms "
+            elif row["metric"] == "copies":
+                values = f"{row['baseline']:10.1f} -> {row['current']:10.1f} 次复制"
+            else:
+                values = f"{row['baseline'] / 2 ** 20:10.2f} -> {row['current'] / 2 ** 20:10.2f} MiB"
+            print(f"{row['name']:<32} {values} ({row['ratio']:.2f}x){flag}", file=sys.stderr)
+        if any(row["regression"] for row in rows):
+            status = 1
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+cover_cache.py - 按内容寻址的渲染缓存
+
+缓存键是以下内容的稳定哈希：规范化的 params（含种子和各输出的格式，不含输出路径）、
+模板配置（layout/style）以及所引用的字体、背景、装饰图片和自定义图片的文件内容。
+命中时把上次的输出硬链接（跨文件系统时复制）到新的输出路径，不再渲染；未指定种子的
+任务每次结果不同，不缓存。缓存总大小超过上限时淘汰最久未使用的条目。
+
+用法:
+    cache = RenderCache("cache/", max_bytes=2 * 2 ** 30)
+    path = cache.render(renderer, params)
+
+    python cover_cache.py cache/                  # 查看条目数和大小
+    python cover_cache.py cache/ --max-size 512   # 淘汰到 512 MiB 以内
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+from typing import Dict, Any, List, Optional
+
+import cover_engine
+from cover_output import image_format
+from cover_trace import NULL_TRACE
+
+# 渲染结果的算法发生变化时递增，使旧条目全部失效
+CACHE_VERSION = 1
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# 文件内容哈希: 路径 -> ((修改时间, 大小), 哈希)
+_digests: Dict[str, tuple] = {}
+_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> Optional[str]:
+    """文件内容的SHA-256（按修改时间和大小缓存），文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _digests_lock:
+        entry = _digests.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def referenced_files(renderer: "cover_engine.CoverRenderer", params: Dict[str, Any]) -> List[str]:
+    """渲染 params 可能读取的文件：模板素材、各元素的字体，以及 params 中指定的自定义图片"""
+    plan = renderer.plan
+    files = set(cover_engine.template_asset_paths(plan))
+    for elem in plan.elements:
+        font_path = getattr(elem.style, "font_path", None)
+        if font_path:
+            files.add(font_path)
+        if isinstance(elem, cover_engine.ImageElement):
+            for key in (elem.id, elem.param_key):
+                value = params.get(key)
+                if isinstance(value, str) and os.path.isfile(value):
+                    files.add(value)
+    return sorted(files)
+
+
+def link_outputs(sources: List[str], targets: List[str], link: bool = True):
+    """把 sources 逐个硬链接（不支持时复制）到 targets，先写临时文件再重命名"""
+    for src, dst in zip(sources, targets):
+        if os.path.abspath(src) == os.path.abspath(dst):
+            continue
+        directory, name = os.path.split(os.path.abspath(dst))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            if link:
+                try:
+                    os.link(src, temp_path)
+                except OSError:
+                    shutil.copyfile(src, temp_path)
+            else:
+                shutil.copyfile(src, temp_path)
+            os.replace(temp_path, dst)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+class RenderCache:
+    """
+    渲染结果缓存
+
+    每个条目是 directory 下以键命名的目录，按输出顺序存放 0.jpg、1.jpg 等文件；
+    目录的修改时间记录最近一次使用。link 为 False 时命中和写入都复制文件而不是硬链接
+    （输出文件之后会被原地修改时使用）。
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES, link: bool = True):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.deduplicated = 0
+        self.uncacheable = 0
+        self._lock = threading.Lock()
+        # 键 -> [字节数, 最近使用时间]
+        self._entries: Optional[Dict[str, list]] = None
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _index(self) -> Dict[str, list]:
+        """首次使用时扫描缓存目录，之后在内存中维护"""
+        if self._entries is None:
+            entries = {}
+            if os.path.isdir(self.directory):
+                for prefix in os.listdir(self.directory):
+                    prefix_dir = os.path.join(self.directory, prefix)
+                    if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                        continue
+                    for key in os.listdir(prefix_dir):
+                        entry = os.path.join(prefix_dir, key)
+                        try:
+                            size = sum(os.path.getsize(os.path.join(entry, n)) for n in os.listdir(entry))
+                            entries[key] = [size, os.stat(entry).st_mtime]
+                        except OSError:
+                            continue
+            self._entries = entries
+        return self._entries
+
+    def key(self, renderer: "cover_engine.CoverRenderer", params: Dict[str, Any]) -> Optional[str]:
+        """返回 params 的缓存键；没有种子（结果随机）时返回 None"""
+        if params.get("seed") is None:
+            return None
+        payload = {
+            "version": CACHE_VERSION,
+            "params": {k: v for k, v in params.items() if k != "output_path"},
+            "formats": [image_format(path) for path in renderer.output_paths(params)],
+            "template": [renderer.layout, renderer.style],
+            "files": {path: file_digest(path) for path in referenced_files(renderer, params)},
+        }
+        text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _files(self, key: str) -> Optional[List[str]]:
+        entry = self._entry_dir(key)
+        try:
+            names = os.listdir(entry)
+        except OSError:
+            return None
+        names.sort(key=lambda n: int(n.split(".", 1)[0]))
+        return [os.path.join(entry, n) for n in names]
+
+    def restore(self, key: str, paths: List[str]) -> bool:
+        """命中时把缓存的输出链接到 paths 并返回 True，未命中返回 False"""
+        files = self._files(key)
+        if files is None or len(files) != len(paths):
+            with self._lock:
+                self.misses += 1
+            return False
+        link_outputs(files, paths, self.link)
+        now = time.time()
+        try:
+            os.utime(self._entry_dir(key), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            entry = self._index().get(key)
+            if entry is not None:
+                entry[1] = now
+        return True
+
+    def store(self, key: str, paths: List[str]):
+        """把刚渲染的输出 paths 存为 key 的条目（已存在时保留原条目），超出上限时淘汰"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_dir = os.path.join(self.directory, f".{uuid.uuid4().hex[:8]}.tmp")
+        os.makedirs(temp_dir)
+        try:
+            targets = [os.path.join(temp_dir, f"{i}{os.path.splitext(p)[1].lower()}")
+                       for i, p in enumerate(paths)]
+            link_outputs(paths, targets, self.link)
+            size = sum(os.path.getsize(t) for t in targets)
+            entry = self._entry_dir(key)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.rename(temp_dir, entry)
+        except OSError:
+            # 其他进程已写入同一条目
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+        with self._lock:
+            self.stores += 1
+            self._index()[key] = [size, time.time()]
+        self.evict()
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """按最近使用时间淘汰条目，直到总大小不超过 max_bytes（默认 self.max_bytes），返回淘汰数"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        removed = []
+        with self._lock:
+            entries = self._index()
+            total = sum(size for size, _ in entries.values())
+            for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= limit:
+                    break
+                del entries[key]
+                total -= size
+                removed.append(key)
+            self.evictions += len(removed)
+        for key in removed:
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        return len(removed)
+
+    def render(self, renderer: "cover_engine.CoverRenderer", params: Dict[str, Any],
+               trace=NULL_TRACE) -> str:
+        """同 renderer.render，命中缓存时直接链接上次的输出"""
+        key = self.key(renderer, params)
+        if key is None:
+            with self._lock:
+                self.uncacheable += 1
+            return renderer.render(params, trace)
+        paths = renderer.output_paths(params)
+        if self.restore(key, paths):
+            return paths[0]
+        path = renderer.render(params, trace)
+        self.store(key, paths)
+        return path
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._index()
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                    "evictions": self.evictions, "deduplicated": self.deduplicated,
+                    "uncacheable": self.uncacheable, "entries": len(entries),
+                    "bytes": sum(size for size, _ in entries.values()), "max_bytes": self.max_bytes}
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    return (f"缓存: 命中 {stats['hits']}，未命中 {stats['misses']}，合并重复 {stats['deduplicated']}，"
+            f"不可缓存 {stats['uncacheable']}，写入 {stats['stores']}，淘汰 {stats['evictions']}；"
+            f"{stats['entries']} 个条目，{stats['bytes'] / 2 ** 20:.1f} / {stats['max_bytes'] / 2 ** 20:.0f} MiB")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="查看或清理渲染缓存")
+    parser.add_argument("directory", help="缓存目录")
+    parser.add_argument("--max-size", type=int, default=None, help="淘汰到该大小（MiB）以内")
+    parser.add_argument("--clear", action="store_true", help="删除全部条目")
+    args = parser.parse_args(argv)
+
+    cache = RenderCache(args.directory)
+    if args.clear:
+        cache.clear()
+    elif args.max_size is not None:
+        cache.max_bytes = args.max_size * 2 ** 20
+        cache.evict()
+    print(format_stats(cache.stats()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,24 @@
 import os
 import json
-import glob
 import random
 import copy
+import time
+import functools
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait as futures_wait
+from types import MappingProxyType
 from typing import Dict, Any, List, Optional, Union
 
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 
+from cover_assets import find_assets, load_element_bitmap, load_stored_pixels, image_view, AssetStore, set_asset_store, BITMAP_CACHE
+from cover_output import OutputWriter, save_image, encode_image, downscale_chain
+from cover_trace import NULL_TRACE, RenderTrace, MemoryTrace, activate, current_trace, count_frame_copy
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LAYOUT_PATH = os.path.join(BASE_DIR, "layout.json")
 STYLE_PATH = os.path.join(BASE_DIR, "style.json")
@@ -41,39 +51,346 @@ def hex_to_rgba(color: str):
     return (255, 255, 255, 255)
 
 
-def apply_opencv_filters(pil_img: Image.Image, filters_cfg: Dict[str, Any]) -> Image.Image:
-    """应用OpenCV滤镜"""
-    if not filters_cfg.get("enable", True):
-        return pil_img
+class FontCache:
+    """
+    进程级字体缓存，按 (字体路径, 字体索引, 字号) 缓存 FreeTypeFont 对象
+
+    超过 maxsize 时淘汰最久未使用的字体；hits/misses 计数用于确认批量渲染时缓存生效。
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fonts: "OrderedDict[tuple, ImageFont.FreeTypeFont]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, font_path: str, size: int, index: int = 0) -> ImageFont.FreeTypeFont:
+        key = (font_path, index, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return font
+            self.misses += 1
+
+        # 在锁外解析字体文件，加载失败时抛出异常且不缓存
+        font = ImageFont.truetype(font_path, size, index=index)
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.maxsize:
+                self._fonts.popitem(last=False)
+        return font
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._fonts), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+FONT_CACHE = FontCache()
+
+
+def load_font(font_path: str, size: int, index: int = 0) -> ImageFont.FreeTypeFont:
+    """通过进程级缓存加载TrueType字体（index为TTC字体集中的字体序号）"""
+    return FONT_CACHE.get(font_path, size, index)
+
+
+def font_cache_stats() -> Dict[str, int]:
+    """返回字体缓存的命中/未命中计数"""
+    return FONT_CACHE.stats()
+
+
+def _writes_through(image: Image.Image, array: np.ndarray) -> bool:
+    """在 image 上改写一个像素，检查 array 是否随之改变（之后恢复原值）"""
+    original = image.getpixel((0, 0))
+    probe = tuple(255 - v for v in original)
+    image.putpixel((0, 0), probe)
+    shared = tuple(int(v) for v in array[0, 0]) == probe
+    image.putpixel((0, 0), original)
+    return shared
+
+
+class Frame:
+    """
+    一张封面的像素缓冲区（H x W x 4 uint8）及共享该内存的可写RGBA图像
+
+    可写视图依赖Pillow的非公开行为（image_view 把 frombuffer 图像标记为可写），创建时
+    先写一个像素确认图像确实共享 array；不共享时（shared 为 False）改在图像的独立副本上绘制，
+    rgb() 和 pixels() 再从图像复制，结果不变。
+    """
+    __slots__ = ("array", "image", "shared")
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.image = image_view(array, "RGBA")
+        self.shared = _writes_through(self.image, array)
+        if not self.shared:
+            count_frame_copy()
+            self.image = image_view(array, "RGBA").copy()
+
+    def rgb(self) -> Image.Image:
+        """同一块内存的RGBX视图（不含Alpha），用于缩放和编码"""
+        if not self.shared:
+            count_frame_copy()
+            return self.image.convert("RGB")
+        return image_view(self.array, "RGBX")
+
+    def pixels(self) -> np.ndarray:
+        """绘制后的RGBA像素（共享内存时即 array）"""
+        return self.array if self.shared else np.asarray(self.image)
+
+
+class BackgroundCache:
+    """
+    已解码背景图缓存，按 (路径, 修改时间, 文件大小) 识别文件是否变化
+
+    缓存的是解码后的只读RGBA像素数组（与每张封面的随机调色无关）以及共享该内存的
+    只读图像视图，调用方须在副本上绘制。启用素材库（cover_assets.set_asset_store）时
+    直接映射库中预解码的像素，不解码源文件。
+    """
+
+    def __init__(self, maxsize: int = 4):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._images: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> tuple:
+        """返回 (只读图像视图, 只读像素数组)"""
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._images.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._images.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        array = load_stored_pixels(path)
+        if array is None:
+            with Image.open(path) as img:
+                array = np.array(img.convert("RGBA"))
+            array.flags.writeable = False
+        return self.put(path, array, stamp)
+
+    def put(self, path: str, array: np.ndarray, stamp: tuple) -> tuple:
+        """
+        放入已解码的只读RGBA像素（如共享内存中的视图），stamp 为解码时源文件的 (修改时间, 大小)
+
+        源文件之后发生变化时 get() 不会命中该条目，而是重新解码。
+        """
+        pixels = (image_view(array), array)
+        with self._lock:
+            self._images[path] = (tuple(stamp), pixels)
+            self._images.move_to_end(path)
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return pixels
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._images), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+BACKGROUND_CACHE = BackgroundCache()
+
+
+def load_background(path: str) -> Image.Image:
+    """返回解码后的RGBA背景图（缓存共享的只读图像，绘制前须复制）"""
+    return BACKGROUND_CACHE.get(path)[0]
+
 
-    img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+def load_background_array(path: str) -> np.ndarray:
+    """返回解码后的RGBA背景像素（缓存共享的只读数组）"""
+    return BACKGROUND_CACHE.get(path)[1]
 
-    # 对比度和亮度调整
+
+# 暗角蒙版的定点数精度（Q15，1.0 = 32768）
+VIGNETTE_SHIFT = 15
+
+
+# 批量滤镜每块封面缓冲区的字节数上限
+FILTER_BATCH_BYTES = 256 * 1024 * 1024
+
+
+def tone_luts(alphas, betas) -> np.ndarray:
+    """
+    一组RGBA对比度/亮度查找表（N x 1 x 256 x 4，Alpha通道不变），一次向量化计算，
+    RGB通道与 cv2.convertScaleAbs(alpha, beta) 的逐像素结果相同
+    """
+    alphas = np.asarray(alphas, dtype=np.float64).reshape(-1, 1)
+    betas = np.asarray(betas, dtype=np.float64).reshape(-1, 1)
+    values = np.abs(np.arange(256, dtype=np.float64) * alphas + betas)
+    lut = np.clip(np.rint(values), 0, 255).astype(np.uint8)
+    identity = np.broadcast_to(np.arange(256, dtype=np.uint8), lut.shape)
+    return np.stack([lut, lut, lut, identity], axis=-1).reshape(len(lut), 1, 256, 4)
+
+
+def tone_lut(alpha: float, beta: int) -> np.ndarray:
+    """单组参数的RGBA对比度/亮度查找表（1x256x4）"""
+    return tone_luts([alpha], [beta])[0]
+
+
+# 由 set_vignette_mask 放入的蒙版（如共享内存中的视图），优先于按需计算
+_VIGNETTE_MASKS: Dict[tuple, np.ndarray] = {}
+
+
+def set_vignette_mask(width: int, height: int, strength: float, mask: np.ndarray):
+    """使用已计算好的只读暗角蒙版（来自 vignette_mask 的结果），不再在本进程中计算"""
+    _VIGNETTE_MASKS[(width, height, float(strength))] = mask
+
+
+def vignette_mask(width: int, height: int, strength: float) -> np.ndarray:
+    """RGBA高斯暗角蒙版（uint16定点数，Alpha通道恒为1.0），按尺寸和强度缓存"""
+    mask = _VIGNETTE_MASKS.get((width, height, float(strength)))
+    if mask is None:
+        mask = _compute_vignette_mask(width, height, strength)
+    return mask
+
+
+@functools.lru_cache(maxsize=8)
+def _compute_vignette_mask(width: int, height: int, strength: float) -> np.ndarray:
+    x = cv2.getGaussianKernel(width, int(width * strength))
+    y = cv2.getGaussianKernel(height, int(height * strength))
+    mask = y * x.T
+    mask = mask / mask.max()
+    mask = np.rint(mask * (1 << VIGNETTE_SHIFT)).astype(np.uint16)
+    opaque = np.full_like(mask, 1 << VIGNETTE_SHIFT)
+    mask = np.ascontiguousarray(np.dstack([mask, mask, mask, opaque]))
+    mask.flags.writeable = False
+    return mask
+
+
+def draw_tone_params(filters_cfg: Dict[str, Any],
+                     rng: Optional[np.random.RandomState] = None) -> tuple:
+    """抽取一张封面的 (对比度, 亮度)，rng 为空时使用全局 np.random"""
     cr = filters_cfg.get("contrast_range", [1.0, 1.0])
     br = filters_cfg.get("brightness_range", [0, 0])
-    alpha = float(np.random.uniform(cr[0], cr[1]))
-    beta = int(np.random.randint(br[0], br[1] + 1))
-    img = cv2.convertScaleAbs(img, alpha=alpha, beta=beta)
+    np_rng = rng if rng is not None else np.random
+    alpha = float(np_rng.uniform(cr[0], cr[1]))
+    beta = int(np_rng.randint(br[0], br[1] + 1))
+    return alpha, beta
+
+
+def _filter_pixels(src: np.ndarray, dst: np.ndarray, lut: Optional[np.ndarray],
+                   filters_cfg: Dict[str, Any]):
+    """
+    查找表调色后原地乘以暗角蒙版，src 与 dst 可以是同一块缓冲区
 
-    # 暗角效果
+    lut 为空（滤镜关闭）时只把 src 复制到 dst
+    """
+    if lut is None:
+        if dst is not src:
+            np.copyto(dst, src)
+        return
+    cv2.LUT(src, lut, dst=dst)
     vg_strength = float(filters_cfg.get("vignette_strength", 0.0))
     if vg_strength > 0:
-        h, w = img.shape[:2]
-        x = cv2.getGaussianKernel(w, int(w * vg_strength))
-        y = cv2.getGaussianKernel(h, int(h * vg_strength))
-        mask = y * x.T
-        mask = mask / mask.max()
-        mask = cv2.merge([mask, mask, mask])
-        img = (img * mask).astype(np.uint8)
-
-    return Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-
-
-def get_random_variation(variation_cfg: Dict[str, Any], seed: Optional[int] = None) -> Dict[str, Any]:
-    """根据配置生成随机变化"""
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
+        h, w = dst.shape[:2]
+        mask = vignette_mask(w, h, vg_strength)
+        cv2.multiply(dst, mask, dst=dst, scale=1.0 / (1 << VIGNETTE_SHIFT), dtype=cv2.CV_8U)
+
+
+def apply_opencv_filters(pil_img: Image.Image, filters_cfg: Dict[str, Any],
+                         rng: Optional[np.random.RandomState] = None) -> Image.Image:
+    """
+    应用OpenCV滤镜：随机对比度/亮度和暗角
+
+    对比度/亮度折算成查找表，暗角使用缓存的定点数蒙版，二者都原地作用于同一块
+    RGBA uint8缓冲区，Alpha通道保持不变。rng 为空时使用全局 np.random。
+    """
+    if not filters_cfg.get("enable", True):
+        return pil_img
+
+    mode = pil_img.mode
+    img = np.array(pil_img if mode == "RGBA" else pil_img.convert("RGBA"))
+    count_frame_copy()
+
+    # 对比度和亮度调整，然后是暗角效果
+    _filter_pixels(img, img, tone_lut(*draw_tone_params(filters_cfg, rng)), filters_cfg)
+
+    # 返回共享 img 内存的可写图像，之后在其上绘制不会再复制
+    result = image_view(img)
+    return result if mode == "RGBA" else result.convert(mode)
+
+
+def filter_frame(src: np.ndarray, dst: np.ndarray, filters_cfg: Dict[str, Any],
+                 rng: Optional[np.random.RandomState] = None):
+    """
+    把背景像素 src 调色后写入 dst（一次整帧读写，不修改 src）
+
+    随机数的抽取与 apply_opencv_filters 相同；滤镜关闭时直接复制。
+    """
+    lut = None
+    if filters_cfg.get("enable", True):
+        lut = tone_lut(*draw_tone_params(filters_cfg, rng))
+    _filter_pixels(src, dst, lut, filters_cfg)
+    count_frame_copy()
+
+
+def filter_chunk_size(width: int, height: int, max_bytes: int = FILTER_BATCH_BYTES) -> int:
+    """批量滤镜每块处理的封面数，使整块RGBA缓冲区不超过 max_bytes"""
+    return max(1, max_bytes // (width * height * 4))
+
+
+def filter_frames(src: np.ndarray, filters_cfg: Dict[str, Any],
+                  rngs: List[np.random.RandomState]) -> np.ndarray:
+    """
+    对同一背景像素批量调色，返回 N x H x W x 4 数组，第 i 帧使用 rngs[i] 抽取的参数
+
+    先按顺序为所有封面抽取参数（与逐张调用 apply_opencv_filters 时的随机序列相同），
+    一次向量化计算全部查找表，再从共享的源像素直接写入整块缓冲区。
+    结果与逐张调用完全一致；调用方应按 filter_chunk_size 分块以限制内存。
+    """
+    chunk = np.empty((len(rngs),) + src.shape, dtype=np.uint8)
+    if not filters_cfg.get("enable", True):
+        chunk[...] = src
+    else:
+        params = [draw_tone_params(filters_cfg, rng) for rng in rngs]
+        luts = tone_luts([p[0] for p in params], [p[1] for p in params])
+        for i in range(len(rngs)):
+            _filter_pixels(src, chunk[i], luts[i], filters_cfg)
+    count_frame_copy(len(rngs))
+    return chunk
+
+
+def apply_opencv_filters_batch(pil_img: Image.Image, filters_cfg: Dict[str, Any],
+                               rngs: List[np.random.RandomState]) -> List[Image.Image]:
+    """对同一张背景批量应用滤镜（见 filter_frames），返回每个 rng 对应的一张可写图像"""
+    mode = pil_img.mode
+    src = np.asarray(pil_img if mode == "RGBA" else pil_img.convert("RGBA"))
+    results = [image_view(frame) for frame in filter_frames(src, filters_cfg, rngs)]
+    return results if mode == "RGBA" else [img.convert(mode) for img in results]
+
+
+def get_random_variation(variation_cfg: Dict[str, Any], seed: Optional[int] = None,
+                         rng: Optional[random.Random] = None) -> Dict[str, Any]:
+    """根据配置生成随机变化（rng 为空时使用并重置全局随机数生成器）"""
+    if rng is None:
+        rng = random
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+    elif seed is not None:
+        rng.seed(seed)
     
     result = {}
     
@@ -81,33 +398,33 @@ def get_random_variation(variation_cfg: Dict[str, Any], seed: Optional[int] = No
     if "jitter_x" in variation_cfg:
         jitter = variation_cfg["jitter_x"]
         if isinstance(jitter, list) and len(jitter) == 2:
-            result["jitter_x"] = random.randint(jitter[0], jitter[1])
+            result["jitter_x"] = rng.randint(jitter[0], jitter[1])
     
     if "jitter_y" in variation_cfg:
         jitter = variation_cfg["jitter_y"]
         if isinstance(jitter, list) and len(jitter) == 2:
-            result["jitter_y"] = random.randint(jitter[0], jitter[1])
+            result["jitter_y"] = rng.randint(jitter[0], jitter[1])
     
     # 色彩微调
     if "color_adjust" in variation_cfg:
         color_adj = variation_cfg["color_adjust"]
         if isinstance(color_adj, list) and len(color_adj) == 2:
-            adj_r = random.randint(color_adj[0], color_adj[1])
-            adj_g = random.randint(color_adj[0], color_adj[1])
-            adj_b = random.randint(color_adj[0], color_adj[1])
+            adj_r = rng.randint(color_adj[0], color_adj[1])
+            adj_g = rng.randint(color_adj[0], color_adj[1])
+            adj_b = rng.randint(color_adj[0], color_adj[1])
             result["color_adjust"] = (adj_r, adj_g, adj_b)
     
     # 透明度变化
     if "opacity_range" in variation_cfg:
         opacity_range = variation_cfg["opacity_range"]
         if isinstance(opacity_range, list) and len(opacity_range) == 2:
-            result["opacity"] = random.uniform(opacity_range[0], opacity_range[1])
+            result["opacity"] = rng.uniform(opacity_range[0], opacity_range[1])
     
     # 旋转角度
     if "rotate_range" in variation_cfg:
         rotate_range = variation_cfg["rotate_range"]
         if isinstance(rotate_range, list) and len(rotate_range) == 2:
-            result["rotate"] = random.randint(rotate_range[0], rotate_range[1])
+            result["rotate"] = rng.randint(rotate_range[0], rotate_range[1])
     
     return result
 
@@ -125,49 +442,183 @@ def adjust_color(color: tuple, adjustment: Optional[tuple]) -> tuple:
     return (r, g, b, a)
 
 
-def draw_text_with_style(draw, elem_box, text, style_cfg, font_dir, align="left", 
-                         variation: Optional[Dict[str, Any]] = None):
-    """绘制带样式的文本"""
-    if not text:
+def _composite_layer(canvas: Image.Image, layer: Image.Image, x: int, y: int):
+    """将RGBA图层合成到画布的 (x, y) 处，超出画布左上边界的部分被裁掉"""
+    src_x, src_y = max(0, -x), max(0, -y)
+    if src_x >= layer.width or src_y >= layer.height:
         return
+    canvas.alpha_composite(layer, (max(0, x), max(0, y)), (src_x, src_y))
 
-    # 获取字体文件路径
-    font_file = style_cfg.get("font_file", "MSYHBD.TTC")
-    font_path = os.path.join(font_dir, font_file)
-    
-    # 获取字号配置
-    base_size = style_cfg.get("base_size", style_cfg.get("size", 64))
-    min_size = style_cfg.get("min_size", max(10, base_size // 2))
-    max_size = style_cfg.get("max_size", min(200, base_size * 2))
 
-    w_box, h_box = elem_box["width"], elem_box["height"]
-    font_size = base_size
+def _composite_mask(canvas: Image.Image, mask: np.ndarray, color: tuple, x: int, y: int):
+    """用覆盖蒙版(uint8)和RGBA颜色构造单色图层并合成到画布"""
+    r, g, b, a = color
+    layer = np.empty(mask.shape + (4,), np.uint8)
+    layer[..., 0] = r
+    layer[..., 1] = g
+    layer[..., 2] = b
+    if a == 255:
+        layer[..., 3] = mask
+    else:
+        layer[..., 3] = (mask.astype(np.uint16) * a + 127) // 255
+    _composite_layer(canvas, Image.fromarray(layer, "RGBA"), x, y)
+
+
+def _text_mask(text: str, font, bbox: tuple, x: float, y: float, pad: int) -> tuple:
+    """
+    将文本栅格化为覆盖蒙版(uint8)，四周留出 pad 像素
+
+    bbox 为文本在原点处的 textbbox，返回 (蒙版, 蒙版左上角在画布上的x, y)。
+    蒙版内的绘制坐标保持非负，使亚像素偏移与直接在画布上 draw.text 一致。
+    """
+    ox, oy = int(np.floor(x)), int(np.floor(y))
+    left, top = min(bbox[0], 0) - pad, min(bbox[1], 0) - pad
+    mask_img = Image.new("L", (bbox[2] - left + pad, bbox[3] - top + pad), 0)
+    ImageDraw.Draw(mask_img).text((x - ox - left, y - oy - top), text, font=font, fill=255)
+    return np.asarray(mask_img), ox + left, oy + top
+
+
+def fit_font_size(draw, text: str, font_path: str, w_box: int, h_box: int,
+                  base_size: int, min_size: int, max_size: int, font_index: int = 0) -> int:
+    """
+    求能放进 w_box x h_box 的最大字号
+
+    候选字号为 base_size, base_size-2, ... 直到 min_size（步长2），文本尺寸随字号单调变化，
+    因此对候选序列二分查找，只需 O(log n) 次测量。都放不下时取 min_size，
+    结果再限制在 [min_size, max_size] 内，与逐个递减尝试的结果一致。
+    """
+    # 启用计时时记录尝试过的字号
+    trace = current_trace()
+    tried = [] if trace.enabled else None
+
+    def fits(size: int) -> bool:
+        if tried is not None:
+            tried.append(size)
+        try:
+            font = load_font(font_path, size, font_index)
+            bbox = draw.textbbox((0, 0), text, font=font)
+        except Exception:
+            return False
+        return bbox[2] - bbox[0] <= w_box and bbox[3] - bbox[1] <= h_box
+
+    # 在候选序号 [lo, hi) 中找第一个能放下的
+    n_candidates = (base_size - min_size) // 2 + 1 if base_size >= min_size else 0
+    lo, hi = 0, n_candidates
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fits(base_size - 2 * mid):
+            hi = mid
+        else:
+            lo = mid + 1
+
+    font_size = base_size - 2 * lo if lo < n_candidates else min_size
+    font_size = max(min(font_size, max_size), min_size)
+    if tried is not None:
+        trace.note(fit_sizes=tried, font_size=font_size)
+    return font_size
+
+
+class CanvasDraw(ImageDraw.ImageDraw):
+    """保存画布图像引用的 ImageDraw，文字、徽章和图片元素直接在 canvas 上 alpha_composite"""
+
+    def __init__(self, canvas: Image.Image, mode: Optional[str] = None):
+        super().__init__(canvas, mode)
+        self.canvas = canvas
+
+
+def _canvas_of(draw) -> Image.Image:
+    """
+    获取绘制对象的画布图像（draw.im是底层对象，不支持alpha_composite）
+
+    引擎内部使用 CanvasDraw；外部直接传入的 ImageDraw.Draw 对象只能从其非公开属性取得画布。
+    """
+    canvas = getattr(draw, "canvas", None)
+    if canvas is None:
+        canvas = getattr(draw, "_image", None)
+    if not isinstance(canvas, Image.Image):
+        raise TypeError("draw 必须是 CanvasDraw，或由 ImageDraw.Draw(图像) 创建")
+    return canvas
+
+
+class TextStyle:
+    """解析后的文本样式：字体路径已解析，颜色已转换为RGBA元组"""
+    __slots__ = ("font_path", "font_index", "base_size", "min_size", "max_size",
+                 "fill_color", "stroke_color", "stroke_width", "shadow")
+
+    def __init__(self, style_cfg: Dict[str, Any], font_dir: str, parse_color=hex_to_rgba):
+        self.font_path = os.path.join(font_dir, style_cfg.get("font_file", "MSYHBD.TTC"))
+        self.font_index = style_cfg.get("font_index", 0)
+
+        # 字号配置
+        self.base_size = style_cfg.get("base_size", style_cfg.get("size", 64))
+        self.min_size = style_cfg.get("min_size", max(10, self.base_size // 2))
+        self.max_size = style_cfg.get("max_size", min(200, self.base_size * 2))
+
+        self.fill_color = parse_color(style_cfg.get("fill_color", "#FFFFFF"))
+        self.stroke_color = parse_color(style_cfg.get("stroke_color", "#000000"))
+        self.stroke_width = max(0, int(style_cfg.get("stroke_width", 0)))
+
+        # 阴影: (offset_x, offset_y, blur_radius, color) 或 None
+        shadow_cfg = style_cfg.get("shadow", {})
+        self.shadow = None
+        if shadow_cfg.get("enabled", False):
+            self.shadow = (shadow_cfg.get("offset_x", 2), shadow_cfg.get("offset_y", 2),
+                           shadow_cfg.get("blur_radius", 0),
+                           parse_color(shadow_cfg.get("color", "#00000080")))
+
+
+class BadgeStyle:
+    """解析后的徽章样式"""
+    __slots__ = ("font_path", "font_index", "size", "pad_x", "pad_y",
+                 "bg_color", "text_color", "radius", "format")
+
+    def __init__(self, style_cfg: Dict[str, Any], font_dir: str, parse_color=hex_to_rgba,
+                 default_format: str = "CUSTOM"):
+        self.font_path = os.path.join(font_dir, style_cfg.get("font_file", "MSYHBD.TTC"))
+        self.font_index = style_cfg.get("font_index", 0)
+        self.size = style_cfg.get("size", 48)
+        self.pad_x = style_cfg.get("padding_x", 20)
+        self.pad_y = style_cfg.get("padding_y", 10)
+        self.bg_color = parse_color(style_cfg.get("badge_bg_color", "#FFCC00"))
+        self.text_color = parse_color(style_cfg.get("badge_text_color", "#000000"))
+        self.radius = style_cfg.get("corner_radius", 20)
+        self.format = style_cfg.get("format", default_format)
+
+
+class ImageStyle:
+    """解析后的图片样式"""
+    __slots__ = ("image_pattern", "opacity")
+
+    def __init__(self, style_cfg: Dict[str, Any]):
+        self.image_pattern = style_cfg.get("image_pattern", "template/deco_*.png")
+        self.opacity = style_cfg.get("opacity", 1.0)
+
+
+def _box_tuple(elem_box: Dict[str, Any]) -> tuple:
+    return (elem_box["x"], elem_box["y"], elem_box["width"], elem_box["height"])
+
+
+def _draw_text(draw, box: tuple, text: str, style: TextStyle, align: str = "left",
+               variation: Optional[Dict[str, Any]] = None):
+    """按解析后的样式绘制文本，box 为 (x, y, width, height)"""
+    if not text:
+        return
+
+    x, y, w_box, h_box = box
+    font_path, font_index = style.font_path, style.font_index
     
     # 尝试加载字体
     try:
-        # 尝试找到合适的字体大小
-        while font_size >= min_size:
-            try:
-                font = ImageFont.truetype(font_path, font_size)
-                # 使用textbbox获取文本尺寸
-                bbox = draw.textbbox((0, 0), text, font=font)
-                w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
-                if w <= w_box and h <= h_box:
-                    break
-            except:
-                pass
-            font_size -= 2
-        
-        font_size = max(min(font_size, max_size), min_size)
-        font = ImageFont.truetype(font_path, font_size)
+        # 二分查找合适的字体大小
+        font_size = fit_font_size(draw, text, font_path, w_box, h_box,
+                                  style.base_size, style.min_size, style.max_size, font_index)
+        font = load_font(font_path, font_size, font_index)
     except Exception as e:
         # 如果字体加载失败，使用默认字体
         print(f"字体加载失败 {font_path}: {e}")
         font = ImageFont.load_default()
         font_size = 20
 
-    x, y = elem_box["x"], elem_box["y"]
-    
     # 应用位置抖动
     if variation:
         x += variation.get("jitter_x", 0)
@@ -184,47 +635,50 @@ def draw_text_with_style(draw, elem_box, text, style_cfg, font_dir, align="left"
         x = x + (w_box - w_text)
 
     # 获取颜色并应用微调
-    fill_color = hex_to_rgba(style_cfg.get("fill_color", "#FFFFFF"))
+    fill_color = style.fill_color
     if variation and "color_adjust" in variation:
         fill_color = adjust_color(fill_color, variation["color_adjust"])
     
-    stroke_color = hex_to_rgba(style_cfg.get("stroke_color", "#000000"))
-    stroke_width = style_cfg.get("stroke_width", 0)
-
-    # 绘制阴影
-    shadow_cfg = style_cfg.get("shadow", {})
-    if shadow_cfg.get("enabled", False):
-        sx = shadow_cfg.get("offset_x", 2)
-        sy = shadow_cfg.get("offset_y", 2)
-        shadow_color = hex_to_rgba(shadow_cfg.get("color", "#00000080"))
-        draw.text((x + sx, y + sy), text, font=font, fill=shadow_color)
-
-    # 绘制描边
+    stroke_color = style.stroke_color
+    stroke_width = style.stroke_width
+    shadow = style.shadow
+
+    # 阴影、描边和文本都由同一张字形覆盖蒙版生成
+    canvas = _canvas_of(draw)
+    blur_radius = shadow[2] if shadow else 0
+    pad = max(stroke_width, int(np.ceil(blur_radius * 3))) + 1
+    mask, left, top = _text_mask(text, font, bbox, x, y, pad)
+
+    # 绘制阴影：偏移并高斯模糊的蒙版
+    if shadow:
+        sx, sy, _, shadow_color = shadow
+        shadow_mask = mask
+        if blur_radius > 0:
+            shadow_mask = cv2.GaussianBlur(mask, (0, 0), sigmaX=float(blur_radius))
+        _composite_mask(canvas, shadow_mask, shadow_color, left + int(sx), top + int(sy))
+
+    # 绘制描边：对蒙版做方形膨胀
     if stroke_width > 0:
-        for dx in range(-stroke_width, stroke_width + 1):
-            for dy in range(-stroke_width, stroke_width + 1):
-                if dx == 0 and dy == 0:
-                    continue
-                draw.text((x + dx, y + dy), text, font=font, fill=stroke_color)
+        kernel = np.ones((stroke_width * 2 + 1, stroke_width * 2 + 1), np.uint8)
+        _composite_mask(canvas, cv2.dilate(mask, kernel), stroke_color, left, top)
 
     # 绘制文本
-    draw.text((x, y), text, font=font, fill=fill_color)
+    _composite_mask(canvas, mask, fill_color, left, top)
 
 
-def draw_badge(draw, elem_box, text, style_cfg, font_dir, variation: Optional[Dict[str, Any]] = None):
-    """绘制徽章元素"""
+def _draw_badge(draw, box: tuple, text: str, style: BadgeStyle,
+                variation: Optional[Dict[str, Any]] = None):
+    """按解析后的样式绘制徽章，box 为 (x, y, width, height)"""
     if not text:
         return
 
     # 获取字体
-    font_file = style_cfg.get("font_file", "MSYHBD.TTC")
-    font_path = os.path.join(font_dir, font_file)
     try:
-        font = ImageFont.truetype(font_path, style_cfg.get("size", 48))
+        font = load_font(style.font_path, style.size, style.font_index)
     except:
         font = ImageFont.load_default()
 
-    x, y, w, h = elem_box["x"], elem_box["y"], elem_box["width"], elem_box["height"]
+    x, y, w, h = box
     
     # 应用位置抖动
     if variation:
@@ -232,8 +686,7 @@ def draw_badge(draw, elem_box, text, style_cfg, font_dir, variation: Optional[Di
         y += variation.get("jitter_y", 0)
     
     # 获取内边距
-    pad_x = style_cfg.get("padding_x", 20)
-    pad_y = style_cfg.get("padding_y", 10)
+    pad_x, pad_y = style.pad_x, style.pad_y
 
     # 获取文本大小
     bbox = draw.textbbox((0, 0), text, font=font)
@@ -246,68 +699,67 @@ def draw_badge(draw, elem_box, text, style_cfg, font_dir, variation: Optional[Di
     by = y + (h - bh) / 2
 
     # 获取背景色并应用微调
-    bg_color = hex_to_rgba(style_cfg.get("badge_bg_color", "#FFCC00"))
+    bg_color = style.bg_color
     if variation and "color_adjust" in variation:
         bg_color = adjust_color(bg_color, variation["color_adjust"])
-    
-    radius = style_cfg.get("corner_radius", 20)
 
-    # 创建圆角矩形
-    rect = Image.new("RGBA", draw.im.size, (0, 0, 0, 0))
+    # 在只覆盖徽章范围的图层上创建圆角矩形。坐标常为 x.5，Pillow 取整与奇偶有关，
+    # 按偶数像素平移才能与整画布图层的栅格化结果相同
+    canvas = _canvas_of(draw)
+    ox, oy = int(np.floor(bx)) - 2, int(np.floor(by)) - 2
+    ox, oy = ox - ox % 2, oy - oy % 2
+    rect = Image.new("RGBA", (int(np.ceil(bx + bw)) - ox + 2, int(np.ceil(by + bh)) - oy + 2), (0, 0, 0, 0))
     rdraw = ImageDraw.Draw(rect)
-    rdraw.rounded_rectangle([bx, by, bx + bw, by + bh], radius=radius, fill=bg_color)
+    rdraw.rounded_rectangle([bx - ox, by - oy, bx - ox + bw, by - oy + bh], radius=style.radius, fill=bg_color)
     
     # 应用透明度
     opacity = variation.get("opacity", 1.0) if variation else 1.0
     if opacity < 1.0:
-        rect = rect.copy()
         alpha = rect.split()[3]
         alpha = alpha.point(lambda p: p * opacity)
         rect.putalpha(alpha)
     
     # 合成到画布
-    draw.im.alpha_composite(rect)
+    _composite_layer(canvas, rect, ox, oy)
 
     # 绘制徽章文字
-    text_color = hex_to_rgba(style_cfg.get("badge_text_color", "#000000"))
-    draw.text((bx + pad_x, by + pad_y), text, font=font, fill=text_color)
+    mask, left, top = _text_mask(text, font, bbox, bx + pad_x, by + pad_y, 1)
+    _composite_mask(canvas, mask, style.text_color, left, top)
 
 
-def draw_image_element(draw, elem_box, style_cfg, base_dir, 
-                       custom_image_path: Optional[str] = None, 
-                       variation: Optional[Dict[str, Any]] = None):
-    """绘制图片元素"""
+def _draw_image(draw, box: tuple, style: ImageStyle, base_dir: str,
+                custom_image_path: Optional[str] = None,
+                variation: Optional[Dict[str, Any]] = None,
+                rng: Optional[random.Random] = None):
+    """按解析后的样式绘制图片元素，box 为 (x, y, width, height)"""
     # 优先使用自定义图片路径
     image_path = custom_image_path
     
     # 如果没有自定义路径，则使用样式配置中的图片模式
     if not image_path or not os.path.exists(image_path):
-        image_pattern = style_cfg.get("image_pattern", "template/deco_*.png")
+        image_pattern = style.image_pattern
         if image_pattern:
-            pattern_path = os.path.join(base_dir, image_pattern)
-            image_files = glob.glob(pattern_path)
+            image_files = find_assets(image_pattern, base_dir)
             if image_files:
                 # 随机选择一张图片
-                image_path = random.choice(image_files)
+                image_path = (rng or random).choice(image_files)
     
     if not image_path or not os.path.exists(image_path):
         return
     
+    x, y, width, height = box
     try:
-        # 打开并处理图片
-        img = Image.open(image_path).convert("RGBA")
-        
-        # 缩放图片到元素大小
-        img = img.resize((elem_box["width"], elem_box["height"]), Image.Resampling.LANCZOS)
+        # 从缓存获取已缩放到元素大小的图片（共享对象，以下变化都生成新图像）
+        img = load_element_bitmap(image_path, (width, height))
         
         # 应用旋转
         if variation and "rotate" in variation:
             img = img.rotate(variation["rotate"], expand=True, resample=Image.Resampling.BICUBIC)
             # 重新调整大小
-            img = img.resize((elem_box["width"], elem_box["height"]), Image.Resampling.LANCZOS)
+            img = img.resize((width, height), Image.Resampling.LANCZOS)
         
         # 应用透明度
-        opacity = variation.get("opacity", 1.0) if variation else style_cfg.get("opacity", 1.0)
+        opacity = variation.get("opacity", 1.0) if variation else style.opacity
         if opacity < 1.0:
             img = img.copy()
             alpha = img.split()[3]
@@ -315,16 +767,35 @@ def draw_image_element(draw, elem_box, style_cfg, base_dir,
             img.putalpha(alpha)
         
         # 粘贴到画布上
-        x, y = elem_box["x"], elem_box["y"]
         if variation:
             x += variation.get("jitter_x", 0)
             y += variation.get("jitter_y", 0)
         
-        draw.im.alpha_composite(img, (int(x), int(y)))
+        _canvas_of(draw).alpha_composite(img, (int(x), int(y)))
     except Exception as e:
         print(f"无法加载图片 {image_path}: {e}")
 
 
+def draw_text_with_style(draw, elem_box, text, style_cfg, font_dir, align="left", 
+                         variation: Optional[Dict[str, Any]] = None):
+    """绘制带样式的文本"""
+    _draw_text(draw, _box_tuple(elem_box), text, TextStyle(style_cfg, font_dir), align, variation)
+
+
+def draw_badge(draw, elem_box, text, style_cfg, font_dir, variation: Optional[Dict[str, Any]] = None):
+    """绘制徽章元素"""
+    _draw_badge(draw, _box_tuple(elem_box), text, BadgeStyle(style_cfg, font_dir), variation)
+
+
+def draw_image_element(draw, elem_box, style_cfg, base_dir, 
+                       custom_image_path: Optional[str] = None, 
+                       variation: Optional[Dict[str, Any]] = None,
+                       rng: Optional[random.Random] = None):
+    """绘制图片元素"""
+    _draw_image(draw, _box_tuple(elem_box), ImageStyle(style_cfg), base_dir,
+                custom_image_path, variation, rng)
+
+
 def get_default_element_config(element_type: str, element_id: str) -> tuple:
     """获取元素的默认配置"""
     # 默认布局配置
@@ -459,7 +930,770 @@ def delete_element(element_id: str) -> bool:
         return False
 
 
-def render_cover(params: Dict[str, Any]) -> str:
+# 预定义参数映射
+PARAM_MAPPING = {
+    "title_main": "title",
+    "tagline": "tagline",
+    "episode_badge": "episode"
+}
+
+ELEMENT_TYPES = ("text", "badge", "image")
+ALIGNMENTS = ("left", "center", "right")
+VARIATION_RANGES = ("jitter_x", "jitter_y", "color_adjust", "opacity_range", "rotate_range")
+# 以 random.randint 取值的范围，端点必须是整数
+INTEGER_VARIATION_RANGES = ("jitter_x", "jitter_y", "color_adjust", "rotate_range")
+
+
+class TemplateError(ValueError):
+    """模板校验错误，element_id 为出错元素的ID（全局配置错误时为 None）"""
+
+    def __init__(self, message: str, element_id: Optional[str] = None):
+        self.element_id = element_id
+        if element_id is not None:
+            message = f"元素 '{element_id}': {message}"
+        super().__init__(message)
+
+
+def parse_color(color) -> tuple:
+    """严格解析十六进制颜色（#RRGGBB 或 #RRGGBBAA），格式错误时抛出 ValueError"""
+    if color is None:
+        return (255, 255, 255, 255)
+    if not isinstance(color, str):
+        raise ValueError(f"颜色必须是字符串: {color!r}")
+    value = color.lstrip("#")
+    if len(value) not in (6, 8):
+        raise ValueError(f"无效的颜色值: {color!r}")
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        raise ValueError(f"无效的颜色值: {color!r}")
+    return hex_to_rgba(color)
+
+
+class PlanElement:
+    """编译后的元素：布局、样式和参数来源都已解析"""
+    __slots__ = ("id", "box", "align", "style", "variation", "param_key")
+    kind = None
+
+    def __init__(self, elem_id: str, box: tuple, align: str, style, variation, param_key: str):
+        self.id = elem_id
+        self.box = box
+        self.align = align
+        self.style = style
+        self.variation = variation
+        self.param_key = param_key
+
+    def render(self, draw, params: Dict[str, Any], variation: Optional[Dict[str, Any]],
+               rng: Optional[random.Random] = None):
+        raise NotImplementedError
+
+    def static_key(self, params: Dict[str, Any]) -> Optional[tuple]:
+        """
+        元素与本次参数无关时返回缓存键（包含所用素材的文件状态），否则返回 None
+
+        有随机变化的元素总是与参数相关。
+        """
+        return None
+
+    def replay_rng(self, rng: random.Random):
+        """使用预合成图层跳过绘制时，重放绘制过程中的随机数调用，保持随机序列一致"""
+
+
+class TextElement(PlanElement):
+    __slots__ = ()
+    kind = "text"
+
+    def render(self, draw, params, variation, rng=None):
+        text = params.get(self.param_key, "")
+        _draw_text(draw, self.box, text, self.style, self.align, variation)
+
+    def static_key(self, params):
+        # 没有传入文本时不绘制任何内容
+        if self.variation or params.get(self.param_key):
+            return None
+        return ()
+
+
+class BadgeElement(PlanElement):
+    __slots__ = ("predefined",)
+    kind = "badge"
+
+    def __init__(self, *args, predefined: bool = False):
+        super().__init__(*args)
+        self.predefined = predefined
+
+    def render(self, draw, params, variation, rng=None):
+        if self.predefined:
+            # 预定义徽章（如episode_badge）
+            ep = params.get(self.param_key)
+            if ep is None:
+                return
+            text = self.style.format.format(ep=int(ep))
+        else:
+            # 自定义徽章，从params中获取文本或使用默认文本
+            text = params.get(self.param_key, self.style.format)
+        _draw_badge(draw, self.box, text, self.style, variation)
+
+    def static_key(self, params):
+        if self.variation:
+            return None
+        if self.predefined:
+            # 没有集数时不绘制
+            return None if params.get(self.param_key) is not None else ()
+        if self.param_key in params:
+            return None
+        # 自定义徽章只显示固定的 format 文本
+        return (_file_stamp(self.style.font_path),)
+
+
+class ImageElement(PlanElement):
+    __slots__ = ("base_dir",)
+    kind = "image"
+
+    def __init__(self, *args, base_dir: str = BASE_DIR):
+        super().__init__(*args)
+        self.base_dir = base_dir
+
+    def render(self, draw, params, variation, rng=None):
+        # 获取自定义图片路径（如果有），没有时检查映射的参数
+        custom_image_path = params.get(self.id)
+        if not custom_image_path and self.param_key != self.id:
+            custom_image_path = params.get(self.param_key)
+        _draw_image(draw, self.box, self.style, self.base_dir, custom_image_path, variation, rng)
+
+    def _pattern_files(self) -> List[str]:
+        if not self.style.image_pattern:
+            return []
+        return find_assets(self.style.image_pattern, self.base_dir)
+
+    def static_key(self, params):
+        if self.variation or params.get(self.id) or params.get(self.param_key):
+            return None
+        files = self._pattern_files()
+        if len(files) > 1:
+            # 多张候选图片时每张封面随机选择
+            return None
+        return tuple(_file_stamp(path) for path in files)
+
+    def replay_rng(self, rng):
+        files = self._pattern_files()
+        if files:
+            rng.choice(files)
+
+
+class RenderPlan:
+    """编译后的模板：全局配置和按绘制顺序排列的已启用元素"""
+    __slots__ = ("font_dir", "bg_path", "filters", "output", "elements")
+
+    def __init__(self, font_dir: str, bg_path: str, filters, output, elements: tuple):
+        self.font_dir = font_dir
+        self.bg_path = bg_path
+        self.filters = filters
+        self.output = output
+        self.elements = elements
+
+
+def _file_stamp(path: str) -> tuple:
+    """文件状态 (路径, 修改时间, 大小)，用于判断素材是否变化"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _check_number(elem_id: str, key: str, value, positive: bool = False, integer: bool = False):
+    if integer and (isinstance(value, bool) or not isinstance(value, int)):
+        raise TemplateError(f"{key} 必须是整数，当前为 {value!r}", elem_id)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TemplateError(f"{key} 必须是数字，当前为 {value!r}", elem_id)
+    if positive and value <= 0:
+        raise TemplateError(f"{key} 必须大于0，当前为 {value!r}", elem_id)
+
+
+def _compile_variation(elem_id: str, variation_cfg) -> Optional[MappingProxyType]:
+    if not variation_cfg:
+        return None
+    if not isinstance(variation_cfg, dict):
+        raise TemplateError("variation 必须是对象", elem_id)
+    for key in VARIATION_RANGES:
+        if key not in variation_cfg:
+            continue
+        value = variation_cfg[key]
+        if not isinstance(value, list) or len(value) != 2:
+            raise TemplateError(f"variation.{key} 必须是 [最小值, 最大值]", elem_id)
+        for v in value:
+            _check_number(elem_id, f"variation.{key}", v, integer=key in INTEGER_VARIATION_RANGES)
+        if value[0] > value[1]:
+            raise TemplateError(f"variation.{key} 的最小值大于最大值: {value!r}", elem_id)
+    return MappingProxyType(copy.deepcopy(variation_cfg))
+
+
+def _compile_element(elem: Dict[str, Any], style_elems: Dict[str, Any],
+                     font_dir: str, base_dir: str) -> PlanElement:
+    elem_id = elem["id"]
+    elem_type = elem.get("type", "text")
+    if elem_type not in ELEMENT_TYPES:
+        raise TemplateError(f"未知的元素类型 {elem_type!r}", elem_id)
+
+    for key in ("x", "y", "width", "height"):
+        if key not in elem:
+            raise TemplateError(f"缺少 {key}", elem_id)
+        _check_number(elem_id, key, elem[key], positive=key in ("width", "height"))
+    box = (elem["x"], elem["y"], elem["width"], elem["height"])
+
+    align = elem.get("align", "left")
+    if align not in ALIGNMENTS:
+        raise TemplateError(f"无效的对齐方式 {align!r}", elem_id)
+
+    elem_style = style_elems.get(elem_id, {})
+    if not isinstance(elem_style, dict):
+        raise TemplateError("样式必须是对象", elem_id)
+    variation = _compile_variation(elem_id, elem_style.get("variation", {}))
+    param_key = PARAM_MAPPING.get(elem_id, elem_id)
+
+    try:
+        if elem_type == "text":
+            shadow_cfg = elem_style.get("shadow", {})
+            if not isinstance(shadow_cfg, dict):
+                raise TemplateError("shadow 必须是对象", elem_id)
+            for key in ("offset_x", "offset_y", "blur_radius"):
+                if key in shadow_cfg:
+                    _check_number(elem_id, f"shadow.{key}", shadow_cfg[key])
+            style = TextStyle(elem_style, font_dir, parse_color)
+            for key in ("base_size", "min_size", "max_size", "stroke_width"):
+                _check_number(elem_id, key, getattr(style, key))
+            return TextElement(elem_id, box, align, style, variation, param_key)
+
+        if elem_type == "badge":
+            predefined = elem_id in PARAM_MAPPING
+            style = BadgeStyle(elem_style, font_dir, parse_color,
+                               "EP {ep:02d}" if predefined else "CUSTOM")
+            for key in ("size", "pad_x", "pad_y", "radius"):
+                _check_number(elem_id, key, getattr(style, key))
+            if predefined:
+                # 提前检查格式字符串，避免渲染时才报错
+                try:
+                    style.format.format(ep=1)
+                except (KeyError, IndexError, ValueError) as e:
+                    raise TemplateError(f"无效的 format {style.format!r}: {e}", elem_id)
+            return BadgeElement(elem_id, box, align, style, variation, param_key,
+                                predefined=predefined)
+
+        style = ImageStyle(elem_style)
+        _check_number(elem_id, "opacity", style.opacity)
+        return ImageElement(elem_id, box, align, style, variation, param_key, base_dir=base_dir)
+    except (ValueError, TypeError) as e:
+        if isinstance(e, TemplateError):
+            raise
+        raise TemplateError(str(e), elem_id)
+
+
+def compile_template(layout: Dict[str, Any], style: Dict[str, Any],
+                     base_dir: str = BASE_DIR) -> RenderPlan:
+    """
+    校验布局/样式配置并编译为渲染计划
+
+    颜色、字体路径、参数映射和默认值都在编译时解析，禁用的元素被剔除；
+    配置有误时抛出 TemplateError（包含元素ID），而不是渲染出残缺的封面。
+    """
+    global_cfg = style.get("global", {})
+    font_dir = os.path.join(base_dir, global_cfg.get("font_dir", "fonts"))
+    bg_path = os.path.join(base_dir, global_cfg.get("template_bg", "template/bg.jpg"))
+    filters = global_cfg.get("opencv_filters", {})
+    if not isinstance(filters, dict):
+        raise TemplateError("global.opencv_filters 必须是对象")
+    # 输出编码参数，如 {"quality": 95, "progressive": true, "optimize": true, "subsampling": 0}
+    output = global_cfg.get("output", {})
+    if not isinstance(output, dict):
+        raise TemplateError("global.output 必须是对象")
+
+    style_elems = style.get("elements", {})
+    seen = set()
+    elements = []
+    for index, elem in enumerate(layout.get("elements", [])):
+        elem_id = elem.get("id") if isinstance(elem, dict) else None
+        if not isinstance(elem_id, str) or not elem_id:
+            raise TemplateError(f"第 {index + 1} 个元素缺少有效的 id")
+        if elem_id in seen:
+            raise TemplateError("元素ID重复", elem_id)
+        seen.add(elem_id)
+
+        if not elem.get("enabled", True):
+            continue
+        elements.append(_compile_element(elem, style_elems, font_dir, base_dir))
+
+    return RenderPlan(font_dir, bg_path, MappingProxyType(copy.deepcopy(filters)),
+                      MappingProxyType(copy.deepcopy(output)), tuple(elements))
+
+
+def _cache_counters() -> Dict[str, int]:
+    """计时用的缓存计数（进程级缓存，多线程渲染时包含其他线程的访问）"""
+    return {"font_hits": FONT_CACHE.hits, "font_misses": FONT_CACHE.misses,
+            "bitmap_hits": BITMAP_CACHE.hits, "bitmap_misses": BITMAP_CACHE.misses}
+
+
+def _new_trace(mode, index: int):
+    """按 trace 参数创建记录：False 不记录，True 记录耗时，"memory" 同时记录内存"""
+    if not mode:
+        return NULL_TRACE
+    if mode == "memory":
+        return MemoryTrace(index=index)
+    return RenderTrace(index=index)
+
+
+def _error_text(e: Exception) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+def _derivative_spec(spec, master_path: str, base_options) -> tuple:
+    """解析一项缩略图声明，返回 ((宽, 高), 路径, 编码参数)"""
+    if isinstance(spec, str):
+        try:
+            width, height = (int(v) for v in spec.lower().split("x"))
+        except ValueError:
+            raise ValueError(f"无效的缩略图尺寸: {spec!r}，应为 宽x高")
+        spec = {"width": width, "height": height}
+    elif not isinstance(spec, dict):
+        raise ValueError(f"无效的缩略图声明: {spec!r}")
+
+    width, height = spec.get("width"), spec.get("height")
+    if not (isinstance(width, int) and isinstance(height, int) and width > 0 and height > 0):
+        raise ValueError(f"缩略图尺寸必须是正整数: {width}x{height}")
+
+    path = spec.get("output_path")
+    if not path:
+        stem, ext = os.path.splitext(master_path)
+        fmt = spec.get("format")
+        path = f"{stem}_{width}x{height}" + (f".{fmt.lower().lstrip('.')}" if fmt else ext)
+
+    options = dict(base_options)
+    options.update((k, v) for k, v in spec.items()
+                   if k not in ("width", "height", "output_path", "format"))
+    return (width, height), path, options
+
+
+class RenderContext:
+    """
+    单次渲染的上下文：渲染计划和独立的随机数生成器
+
+    随机数不再经过全局的 random.seed / np.random.seed，同一渲染器可在多个线程中
+    并发渲染。相同种子产生的随机序列与原先的全局随机数完全相同。
+    """
+    __slots__ = ("plan", "seed", "rng", "np_rng")
+
+    def __init__(self, plan: RenderPlan, seed: Optional[int] = None):
+        self.plan = plan
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.RandomState(seed)
+
+
+class CoverRenderer:
+    """
+    可复用的封面渲染器
+
+    构造时加载并编译一次布局/样式配置，之后可对多组参数重复执行渲染计划。
+    背景图和字体分别通过进程级 BACKGROUND_CACHE、FONT_CACHE 复用，
+    背景文件变化时自动重新解码。渲染结果与逐次调用 render_cover 完全一致。
+
+    与本次参数无关的连续元素（无随机变化的固定装饰图、只显示固定文本的自定义徽章）
+    预先合成为透明图层并缓存，之后的封面直接合成该图层。缓存属于本渲染器的
+    渲染计划，键中包含画布尺寸和所用字体/图片的文件状态，素材变化时自动重新合成。
+    """
+
+    # 缓存的静态图层数量上限
+    STATIC_LAYER_LIMIT = 16
+
+    def __init__(self, layout_path: Optional[str] = None, style_path: Optional[str] = None,
+                 precompose_static: bool = True, layout: Optional[Dict[str, Any]] = None,
+                 style: Optional[Dict[str, Any]] = None):
+        """可直接传入 layout/style 配置字典，此时不读取配置文件"""
+        self.layout_path = layout_path or LAYOUT_PATH
+        self.style_path = style_path or STYLE_PATH
+        self.layout = layout if layout is not None else load_json(self.layout_path)
+        self.style = style if style is not None else load_json(self.style_path)
+        self.plan = compile_template(self.layout, self.style)
+        self.precompose_static = precompose_static
+        self._static_layers: "OrderedDict[tuple, Optional[tuple]]" = OrderedDict()
+        self._static_lock = threading.Lock()
+
+        # 预先解码背景图，每次渲染从缓存的像素开始
+        load_background_array(self.plan.bg_path)
+
+    def render(self, params: Dict[str, Any], trace=NULL_TRACE) -> str:
+        """
+        渲染单张封面，参数同 render_cover，返回输出路径
+
+        trace 为 RenderTrace 时记录各阶段耗时（见 cover_trace）
+        """
+        frame = self.render_frame(params, trace)
+        with trace.span("outputs"):
+            outputs = self.outputs_for(frame.rgb(), params)
+        for image, path, options in outputs:
+            save_image(image, path, options, trace=trace)
+        trace.finish()
+        return outputs[0][1]
+
+    def render_image(self, params: Dict[str, Any], trace=NULL_TRACE,
+                     background: Optional[np.ndarray] = None) -> Image.Image:
+        """
+        合成单张封面，返回RGBA图像（不写文件）
+
+        background 为 filtered_backgrounds 预先调色好的像素数组时跳过滤镜，直接在其上绘制
+        """
+        return self.render_frame(params, trace, background).image
+
+    def render_frame(self, params: Dict[str, Any], trace=NULL_TRACE,
+                     background: Optional[np.ndarray] = None) -> Frame:
+        """
+        合成单张封面，返回像素缓冲区
+
+        整个过程只有一块RGBA缓冲区：滤镜从缓存的背景像素直接写入，之后的绘制和合成
+        都原地修改它，编码时使用同一内存的RGBX视图。
+        """
+        with activate(trace):
+            return self._compose(params, trace, background)
+
+    def _compose(self, params: Dict[str, Any], trace, background: Optional[np.ndarray]) -> Frame:
+        # 每张封面使用独立的随机数生成器
+        seed = params.get("seed")
+        ctx = RenderContext(self.plan, seed)
+        plan = ctx.plan
+
+        if background is not None:
+            frame = Frame(background)
+        else:
+            with trace.span("background"):
+                src = load_background_array(plan.bg_path)
+                pixels = np.empty_like(src)
+            with trace.span("filters"):
+                filter_frame(src, pixels, plan.filters, ctx.np_rng)
+            frame = Frame(pixels)
+        bg = frame.image
+        draw = CanvasDraw(bg, "RGBA")
+
+        static_run = []
+        for elem in plan.elements:
+            key = elem.static_key(params) if self.precompose_static else None
+            if key is not None:
+                static_run.append((elem, key))
+                continue
+            self._composite_static(ctx, bg, static_run, params, trace)
+            static_run = []
+
+            with trace.span(f"element:{elem.id}", _cache_counters if trace.enabled else None,
+                            type=elem.kind):
+                # 获取随机变化
+                variation = get_random_variation(elem.variation, seed, ctx.rng) if elem.variation else None
+                elem.render(draw, params, variation, ctx.rng)
+        self._composite_static(ctx, bg, static_run, params, trace)
+        return frame
+
+    def render_data(self, params: Dict[str, Any], kind: str = "image", fmt: str = "PNG",
+                    options: Optional[Dict[str, Any]] = None, trace=NULL_TRACE):
+        """
+        在内存中渲染封面，不读写输出目录
+
+        kind:
+            "image": 返回RGB的PIL图像
+            "array": 返回 (高, 宽, 3) 的 uint8 NumPy 数组（渲染缓冲区的视图，不复制）
+            "bytes": 返回按 fmt 编码的字节，options 覆盖 global.output 中的编码参数
+        """
+        if kind not in ("image", "array", "bytes"):
+            raise ValueError(f"未知的返回类型: {kind}")
+        frame = self.render_frame(params, trace)
+        if kind == "image":
+            data = frame.image.convert("RGB")
+            count_frame_copy()
+        elif kind == "array":
+            data = frame.pixels()[..., :3]
+        else:
+            image = frame.rgb()
+            merged = dict(self.plan.output)
+            merged.update(options or {})
+            with trace.span("encode", format=fmt):
+                data = encode_image(image, fmt, merged)
+        trace.finish()
+        return data
+
+    def asset_paths(self) -> List[str]:
+        """模板引用的全部图片素材（见 template_asset_paths）"""
+        return template_asset_paths(self.plan)
+
+    def output_path_for(self, params: Dict[str, Any]) -> str:
+        """确定输出路径，未指定时在 output/ 下按标题和集数生成文件名"""
+        output_path = params.get("output_path")
+        if output_path:
+            return output_path
+
+        # 确保输出目录存在
+        output_dir = os.path.join(BASE_DIR, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # 生成默认文件名
+        title = params.get("title", "cover")
+        episode = params.get("episode", 1)
+        return os.path.join(output_dir, f"{title}_ep{episode:03d}.jpg")
+
+    def outputs_for(self, image: Image.Image, params: Dict[str, Any]) -> List[tuple]:
+        """
+        返回要写出的 (图像, 路径, 编码参数) 列表，第一项是原尺寸封面
+
+        image 可以是渲染缓冲区的RGBX视图，此时原尺寸封面直接用它编码，不再复制。
+
+        params["derivatives"] 声明额外的输出尺寸（列表或逗号分隔的字符串），每项为 "1280x720" 或字典:
+            width, height: int - 尺寸
+            output_path: str | None - 输出路径，默认在主路径后加 _宽x高
+            format: str | None - 未指定路径时使用的扩展名，如 "webp"
+            quality 等: 覆盖 global.output 中的编码参数
+        缩略图由合成结果逐级缩小得到。
+        """
+        master_path = self.output_path_for(params)
+        if image.mode not in ("RGB", "RGBX"):
+            image = image.convert("RGB")
+            count_frame_copy()
+        outputs = [(image, master_path, self.plan.output)]
+
+        specs = self._derivative_specs(params, master_path)
+        if specs:
+            images = downscale_chain(image, [size for size, _, _ in specs])
+            outputs.extend((img, path, options) for img, (_, path, options) in zip(images, specs))
+        return outputs
+
+    def _derivative_specs(self, params: Dict[str, Any], master_path: str) -> List[tuple]:
+        derivatives = params.get("derivatives") or ()
+        if isinstance(derivatives, str):
+            # CSV清单中写作 "1280x720,640x360"
+            derivatives = [d.strip() for d in derivatives.split(",") if d.strip()]
+        return [_derivative_spec(d, master_path, self.plan.output) for d in derivatives]
+
+    def output_paths(self, params: Dict[str, Any]) -> List[str]:
+        """返回 render(params) 将写出的全部路径（顺序同 outputs_for），不渲染"""
+        master_path = self.output_path_for(params)
+        return [master_path] + [path for _, path, _ in self._derivative_specs(params, master_path)]
+
+    def _composite_static(self, ctx: RenderContext, canvas: Image.Image, run: List[tuple],
+                          params: Dict[str, Any], trace=NULL_TRACE):
+        """合成一段连续的参数无关元素，图层按元素及其素材状态缓存"""
+        if not run:
+            return
+        with trace.span("static_layer", elements=[elem.id for elem, _ in run]):
+            self._composite_static_run(ctx, canvas, run, params)
+
+    def _composite_static_run(self, ctx, canvas, run, params):
+        key = (canvas.size, tuple((elem.id, elem_key) for elem, elem_key in run))
+        with self._static_lock:
+            cached = key in self._static_layers
+            entry = self._static_layers.get(key)
+            if cached:
+                self._static_layers.move_to_end(key)
+
+        current_trace().note(cached=cached)
+        if cached:
+            for elem, _ in run:
+                elem.replay_rng(ctx.rng)
+        else:
+            layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
+            layer_draw = CanvasDraw(layer, "RGBA")
+            for elem, _ in run:
+                elem.render(layer_draw, params, None, ctx.rng)
+            # 只保留有内容的区域
+            bbox = layer.getbbox()
+            entry = (layer.crop(bbox), bbox[:2]) if bbox else None
+            with self._static_lock:
+                self._static_layers[key] = entry
+                while len(self._static_layers) > self.STATIC_LAYER_LIMIT:
+                    self._static_layers.popitem(last=False)
+
+        if entry is not None:
+            canvas.alpha_composite(entry[0], entry[1])
+
+    def filtered_backgrounds(self, seeds: List[Optional[int]]) -> np.ndarray:
+        """
+        为一组种子批量生成调色后的背景像素（N x H x W x 4），与逐张渲染时各自的滤镜结果相同
+
+        每一帧可直接作为 render_image 的 background，在其上原地绘制。
+        """
+        rngs = [np.random.RandomState(seed) for seed in seeds]
+        return filter_frames(load_background_array(self.plan.bg_path), self.plan.filters, rngs)
+
+    def _jobs_with_backgrounds(self, jobs, batch_filters: bool):
+        """产出 (序号, 参数, 预先调色的背景或 None)，批量滤镜时按内存上限分块"""
+        jobs = enumerate(jobs)
+        if not batch_filters:
+            for index, params in jobs:
+                yield index, params, None
+            return
+
+        height, width = load_background_array(self.plan.bg_path).shape[:2]
+        chunk_size = filter_chunk_size(width, height)
+        while True:
+            chunk = list(itertools.islice(jobs, chunk_size))
+            if not chunk:
+                return
+            seeds = [params.get("seed") if isinstance(params, dict) else None for _, params in chunk]
+            try:
+                backgrounds = self.filtered_backgrounds(seeds)
+            except Exception:
+                # 出错时逐张渲染，由各任务报告错误
+                backgrounds = [None] * len(chunk)
+            for (index, params), background in zip(chunk, backgrounds):
+                yield index, params, background
+
+    def render_covers(self, jobs, writer: Optional[OutputWriter] = None,
+                      trace=False, batch_filters: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量渲染封面，单个任务失败不会中断整批
+
+        编码和写盘交给 writer（未指定时创建默认的 OutputWriter）在后台完成，
+        与下一张封面的合成重叠进行。batch_filters 为 True 时按块批量完成背景滤镜
+        （见 apply_opencv_filters_batch），结果不变。
+
+        返回与jobs顺序一致的结果列表，每项包含:
+            index: int - 任务序号
+            status: str - "ok" 或 "error"
+            output_path: str | None - 输出路径
+            error: str | None - 错误信息
+            elapsed: float - 从开始合成到最后一个输出写盘结束的耗时（秒，包含在编码队列中的等待）
+            trace: dict - 各阶段耗时（仅 trace=True 或 "memory" 时）
+
+        trace="memory" 时同时记录内存；内存统计是进程级的，此时逐个任务合成并等待写盘完成，
+        不与其他任务重叠。
+        """
+        own_writer = writer is None
+        if own_writer:
+            writer = OutputWriter()
+
+        def collect(result, futures, stamps, job_trace, start):
+            futures_wait(futures)
+            try:
+                paths = [future.result() for future in futures]
+                result["output_path"] = paths[0]
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = _error_text(e)
+            # 写盘线程记录的结束时刻，不含等待后续任务合成的时间
+            end = max(stamps)
+            result["elapsed"] = end - start
+            if trace:
+                job_trace.finish(end)
+                result["trace"] = job_trace.to_dict()
+
+        results = []
+        pending = []
+        try:
+            for index, params, background in self._jobs_with_backgrounds(jobs, batch_filters):
+                start = time.perf_counter()
+                result = {"index": index, "status": "ok", "output_path": None, "error": None}
+                results.append(result)
+                job_trace = _new_trace(trace, index)
+                try:
+                    frame = self.render_frame(params, job_trace, background)
+                    with job_trace.span("outputs"):
+                        outputs = self.outputs_for(frame.rgb(), params)
+                    stamps = []
+                    futures = [writer.submit(*output, trace=job_trace, stamps=stamps) for output in outputs]
+                except Exception as e:
+                    result["status"] = "error"
+                    result["error"] = _error_text(e)
+                    result["elapsed"] = time.perf_counter() - start
+                    if trace:
+                        job_trace.finish()
+                        result["trace"] = job_trace.to_dict()
+                    continue
+                if trace == "memory":
+                    collect(result, futures, stamps, job_trace, start)
+                else:
+                    pending.append((result, futures, stamps, job_trace, start))
+
+            for entry in pending:
+                collect(*entry)
+        finally:
+            if own_writer:
+                writer.close()
+        return results
+
+    def render_job(self, params: Dict[str, Any], index: int = 0, trace=False) -> Dict[str, Any]:
+        """
+        渲染单个任务并捕获异常，返回结果字典（字段见 render_covers）
+
+        trace 为 True 时记录各阶段耗时，为 "memory" 时同时记录各阶段的内存峰值和主要分配位置
+        """
+        start = time.perf_counter()
+        result = {"index": index, "status": "ok", "output_path": None, "error": None}
+        job_trace = _new_trace(trace, index)
+        try:
+            result["output_path"] = self.render(params, job_trace)
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = _error_text(e)
+        result["elapsed"] = time.perf_counter() - start
+        if trace:
+            job_trace.finish()
+            result["trace"] = job_trace.to_dict()
+        return result
+
+
+def template_asset_paths(plan: RenderPlan) -> List[str]:
+    """模板引用的全部图片素材：背景图及各图片元素 image_pattern 匹配的文件"""
+    paths = [plan.bg_path]
+    for elem in plan.elements:
+        if isinstance(elem, ImageElement):
+            paths.extend(p for p in elem._pattern_files() if p not in paths)
+    return paths
+
+
+def prepare_asset_store(directory: str, layout_path: Optional[str] = None,
+                        style_path: Optional[str] = None) -> Dict[str, int]:
+    """
+    把模板引用的素材预解码写入素材库 directory（已是最新的条目跳过）
+
+    返回 {"assets": 素材数, "written": 新写入数}。渲染进程调用
+    cover_assets.set_asset_store(directory) 后以内存映射方式读取，不再解码图片；
+    自定义图片（params 中的路径）不在库中，仍按原方式解码。
+    """
+    plan = compile_template(load_json(layout_path or LAYOUT_PATH), load_json(style_path or STYLE_PATH))
+    store = AssetStore(directory)
+    paths = template_asset_paths(plan)
+    written = sum(1 for path in paths if store.prepare(path))
+    return {"assets": len(paths), "written": written}
+
+
+# 工作进程内的渲染器（由 init_worker 创建）
+_worker_renderer: Optional[CoverRenderer] = None
+
+
+def init_worker(layout_path: str, style_path: str, asset_store: Optional[str] = None,
+                shared: Optional[Dict[str, Any]] = None, warm_up: bool = False):
+    """
+    进程池工作进程初始化：加载模板、背景和字体，创建本进程的渲染器（用 worker_renderer() 取得）
+
+    asset_store 为素材库目录时映射预解码的素材；shared 为 cover_shared.SharedAssets.spec 时
+    使用父进程共享内存中的像素；warm_up 为 True 时先渲染一次，加载字体和素材。
+    """
+    global _worker_renderer
+    set_asset_store(asset_store)
+    if shared:
+        # cover_shared 依赖本模块，在此处导入
+        import cover_shared
+        cover_shared.attach(shared)
+    _worker_renderer = CoverRenderer(layout_path, style_path)
+    if warm_up:
+        try:
+            _worker_renderer.render_data({"title": "预热", "episode": 1, "tagline": "预热"})
+        except Exception:
+            pass
+
+
+def worker_renderer() -> CoverRenderer:
+    """返回 init_worker 在本进程中创建的渲染器"""
+    if _worker_renderer is None:
+        raise RuntimeError("工作进程尚未初始化（init_worker）")
+    return _worker_renderer
+
+
+def render_cover(params: Dict[str, Any], trace=NULL_TRACE, cache=None) -> str:
     """
     渲染封面
     
@@ -469,104 +1703,38 @@ def render_cover(params: Dict[str, Any]) -> str:
         tagline: str | None - 副标题
         output_path: str | None - 输出路径
         seed: int | None - 随机种子
+        derivatives: list | None - 额外输出的缩略图尺寸，如 ["1280x720", {"width": 320, "height": 180, "format": "webp"}]
         其他自定义元素参数: 键名为元素ID，值为文本内容或图片路径
-    """
-    layout = load_json(LAYOUT_PATH)
-    style = load_json(STYLE_PATH)
-
-    global_cfg = style.get("global", {})
-    font_dir = os.path.join(BASE_DIR, global_cfg.get("font_dir", "fonts"))
-    bg_path = os.path.join(BASE_DIR, global_cfg.get("template_bg", "template/bg.jpg"))
 
-    # 设置随机种子
-    seed = params.get("seed")
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
-
-    # 加载背景图片
-    bg = Image.open(bg_path).convert("RGBA")
-    bg = apply_opencv_filters(bg, global_cfg.get("opencv_filters", {}))
-    draw = ImageDraw.Draw(bg, "RGBA")
+    trace 为 cover_trace.RenderTrace 时记录模板加载、背景、滤镜、各元素和编码的耗时；
+    cache 为 cover_cache.RenderCache 时，参数、模板和素材都未变化的封面直接链接上次的输出
+    """
+    with trace.span("load_template"):
+        renderer = CoverRenderer()
+    if cache is not None:
+        return cache.render(renderer, params, trace)
+    return renderer.render(params, trace)
 
-    elements = layout.get("elements", [])
-    style_elems = style.get("elements", {})
 
-    # 预定义参数映射
-    param_mapping = {
-        "title_main": "title",
-        "tagline": "tagline",
-        "episode_badge": "episode"
-    }
+def render_cover_data(params: Dict[str, Any], kind: str = "image", fmt: str = "PNG",
+                      options: Optional[Dict[str, Any]] = None,
+                      layout: Optional[Dict[str, Any]] = None,
+                      style: Optional[Dict[str, Any]] = None):
+    """
+    渲染封面并返回图像、数组或编码字节，不写文件（参数见 CoverRenderer.render_data）
 
-    for elem in elements:
-        if not elem.get("enabled", True):
-            continue
-        
-        elem_id = elem["id"]
-        elem_type = elem.get("type", "text")
-        elem_style = style_elems.get(elem_id, {})
-
-        align = elem.get("align", "left")
-        box = {
-            "x": elem["x"],
-            "y": elem["y"],
-            "width": elem["width"],
-            "height": elem["height"],
-        }
+    layout/style 为配置字典时直接使用，不读取 layout.json / style.json
+    """
+    return CoverRenderer(layout=layout, style=style).render_data(params, kind, fmt, options)
 
-        # 获取随机变化配置
-        variation_cfg = elem_style.get("variation", {})
-        variation = get_random_variation(variation_cfg, seed) if variation_cfg else None
 
-        # 根据元素类型进行渲染
-        if elem_type == "text":
-            # 确定文本来源
-            if elem_id in param_mapping:
-                # 预定义元素从对应的参数获取文本
-                text = params.get(param_mapping[elem_id], "")
-            else:
-                # 自定义元素直接从params中获取，键名为元素ID
-                text = params.get(elem_id, "")
-            
-            draw_text_with_style(draw, box, text, elem_style, font_dir, align=align, variation=variation)
-
-        elif elem_type == "badge":
-            # 确定徽章文本来源
-            if elem_id in param_mapping:
-                # 预定义徽章（如episode_badge）
-                ep = params.get(param_mapping[elem_id])
-                if ep is None:
-                    continue
-                fmt = elem_style.get("format", "EP {ep:02d}")
-                text = fmt.format(ep=int(ep))
-            else:
-                # 自定义徽章，从params中获取文本或使用默认文本
-                text = params.get(elem_id, elem_style.get("format", "CUSTOM"))
-            
-            draw_badge(draw, box, text, elem_style, font_dir, variation=variation)
-
-        elif elem_type == "image":
-            # 获取自定义图片路径（如果有）
-            custom_image_path = params.get(elem_id)
-            if not custom_image_path and elem_id in param_mapping:
-                # 检查是否有映射的参数
-                custom_image_path = params.get(param_mapping[elem_id])
-            
-            draw_image_element(draw, box, elem_style, BASE_DIR, custom_image_path, variation=variation)
-
-    # 确保输出目录存在
-    output_dir = os.path.join(BASE_DIR, "output")
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 确定输出路径
-    output_path = params.get("output_path")
-    if not output_path:
-        # 生成默认文件名
-        title = params.get("title", "cover")
-        episode = params.get("episode", 1)
-        output_path = os.path.join(output_dir, f"{title}_ep{episode:03d}.jpg")
+def render_covers(jobs, layout_path: Optional[str] = None,
+                  style_path: Optional[str] = None, batch_filters: bool = False) -> List[Dict[str, Any]]:
+    """
+    批量渲染封面：模板、背景和字体只加载一次，依次渲染每组参数
 
-    # 保存图片
-    bg.convert("RGB").save(output_path, quality=95)
-    return output_path
\ No newline at end of file
+    jobs: 参数字典的可迭代对象，每项与 render_cover 的 params 相同
+    batch_filters: 按块批量完成共享背景的滤镜
+    返回每个任务的结果（见 CoverRenderer.render_covers）
+    """
+    return CoverRenderer(layout_path, style_path).render_covers(jobs, batch_filters=batch_filters)
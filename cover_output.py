@@ -0,0 +1,187 @@
+"""
+cover_output.py - 封面输出
+
+负责图片编码和写盘：先写入同目录下的临时文件，fsync 后原子重命名为目标文件。
+OutputWriter 用有界线程池在后台编码写盘，使下一张封面的合成与上一张的编码重叠。
+"""
+import io
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image
+
+from cover_trace import NULL_TRACE, count_frame_copy
+
+# 各格式可用的编码参数
+ENCODER_OPTIONS = {
+    "JPEG": ("quality", "progressive", "optimize", "subsampling"),
+    "PNG": ("optimize", "compress_level"),
+    "WEBP": ("quality", "lossless", "method"),
+}
+
+DEFAULT_OPTIONS = {"quality": 95}
+
+
+def image_format(path: str) -> str:
+    """根据扩展名确定图片格式，如 .jpg -> JPEG"""
+    ext = os.path.splitext(path)[1].lower()
+    fmt = Image.registered_extensions().get(ext)
+    if fmt is None:
+        raise ValueError(f"不支持的输出格式: {path}")
+    return fmt
+
+
+def format_name(fmt: str) -> str:
+    """规范化格式名，如 jpg / .jpeg -> JPEG"""
+    name = Image.registered_extensions().get("." + fmt.lower().lstrip("."))
+    if name is None and fmt.upper() in Image.SAVE:
+        name = fmt.upper()
+    if name is None:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+    return name
+
+
+def encoder_options(fmt: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """从输出配置中挑出该格式支持的编码参数"""
+    merged = dict(DEFAULT_OPTIONS)
+    if options:
+        merged.update(options)
+    allowed = ENCODER_OPTIONS.get(fmt, ())
+    return {key: value for key, value in merged.items() if key in allowed}
+
+
+# 编码器可直接读取RGBX（忽略第4字节）且输出与RGB相同的格式，无需先转换为RGB
+RGBX_FORMATS = frozenset({"JPEG", "WEBP"})
+
+
+def prepare_for_format(image: Image.Image, fmt: str) -> Image.Image:
+    """
+    封面统一按RGB输出（与格式无关，JPEG也不支持Alpha通道）
+
+    RGBX视图（共享渲染缓冲区）在 RGBX_FORMATS 中直接编码，其他情况转换为RGB（整帧复制）。
+    """
+    if image.mode == "RGB" or (image.mode == "RGBX" and format_name(fmt) in RGBX_FORMATS):
+        return image
+    count_frame_copy()
+    return image.convert("RGB")
+
+
+def downscale_chain(image: Image.Image, sizes: List[Tuple[int, int]],
+                    resample: int = Image.Resampling.LANCZOS) -> List[Image.Image]:
+    """
+    生成多个缩小尺寸的图像，返回顺序与 sizes 一致
+
+    按面积从大到小逐级缩小，每级以上一级结果为源，而不是每个尺寸都从原图重采样；
+    比上一级还大的尺寸（宽高比不同时）直接从原图缩放。
+    """
+    results: List[Optional[Image.Image]] = [None] * len(sizes)
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True)
+    source = image
+    for i in order:
+        size = tuple(sizes[i])
+        if size == source.size:
+            results[i] = source
+            continue
+        src = source if size[0] <= source.width and size[1] <= source.height else image
+        source = results[i] = src.resize(size, resample)
+    return results
+
+
+def encode_image(image: Image.Image, fmt: str = "PNG",
+                 options: Optional[Dict[str, Any]] = None) -> bytes:
+    """在内存中编码图片，返回编码后的字节"""
+    fmt = format_name(fmt)
+    buf = io.BytesIO()
+    prepare_for_format(image, fmt).save(buf, fmt, **encoder_options(fmt, options))
+    return buf.getvalue()
+
+
+def save_image(image: Image.Image, path: str, options: Optional[Dict[str, Any]] = None,
+               fsync: bool = True, trace=NULL_TRACE) -> str:
+    """
+    编码并原子写入图片
+
+    options 为编码参数（quality, progressive, optimize, subsampling 等），
+    先写入同目录临时文件，fsync 后用 os.replace 重命名，失败时不会留下半个文件。
+    """
+    fmt = image_format(path)
+    with trace.span("encode", path=path, format=fmt):
+        _write_atomic(prepare_for_format(image, fmt), path, fmt, options, fsync)
+    return path
+
+
+def _write_atomic(image: Image.Image, path: str, fmt: str, options, fsync: bool):
+    # 临时文件按默认权限创建（受umask约束），重命名后与直接写入的文件权限一致
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, fmt, **encoder_options(fmt, options))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _save_stamped(stamps: list, image: Image.Image, path: str, options, fsync: bool, trace) -> str:
+    try:
+        return save_image(image, path, options, fsync, trace)
+    finally:
+        stamps.append(time.perf_counter())
+
+
+class OutputWriter:
+    """
+    后台输出队列
+
+    最多 max_workers 个线程同时编码写盘（Pillow编码时释放GIL），排队和进行中的
+    任务不超过 max_pending 个，超过时 submit 阻塞，保证待写图片占用的内存有上限。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 4, fsync: bool = True):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.fsync = fsync
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="cover-output")
+
+    def submit(self, image: Image.Image, path: str, options: Optional[Dict[str, Any]] = None,
+               trace=NULL_TRACE, stamps: Optional[list] = None) -> "Future[str]":
+        """
+        提交一张图片，返回结果为输出路径的 Future；队列已满时阻塞等待
+
+        stamps 为列表时，写盘结束（成功或失败）后在工作线程中追加结束时刻（time.perf_counter()），
+        在 Future 完成之前。
+        """
+        self._slots.acquire()
+        try:
+            if stamps is None:
+                future = self._executor.submit(save_image, image, path, options, self.fsync, trace)
+            else:
+                future = self._executor.submit(_save_stamped, stamps, image, path, options, self.fsync, trace)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
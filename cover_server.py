@@ -0,0 +1,290 @@
+"""
+cover_server.py - 本地HTTP渲染服务
+
+工作进程启动时加载模板、背景和字体并保持常驻，请求只需合成和编码。
+只监听本机地址。
+
+接口:
+    POST /render[?format=png]  请求体为 render_cover 的 params（JSON），返回图片字节
+    GET  /health               存活检查
+    GET  /metrics              请求计数、队列深度和延迟分位数（JSON），--trace 时包含各阶段分位数
+
+用法:
+    python cover_server.py --port 8765 -j 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from typing import Dict, Any, Optional
+
+import cover_engine
+from cover_output import format_name
+from cover_trace import RenderTrace, NULL_TRACE, TraceWriter, aggregate, summarize
+
+# 请求体大小上限
+MAX_BODY_BYTES = 1024 * 1024
+
+# 单个渲染任务的超时（秒）
+RENDER_TIMEOUT = 60
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# 保留用于 /metrics 分阶段统计的最近记录数
+TRACE_WINDOW = 1000
+
+# 工作进程是否记录各阶段耗时（由 _init_worker 设置）
+_worker_trace = False
+
+
+def _init_worker(layout_path: str, style_path: str, trace: bool = False,
+                 asset_store: Optional[str] = None):
+    """工作进程初始化：创建渲染器（见 cover_engine.init_worker）并预热一次"""
+    global _worker_trace
+    cover_engine.init_worker(layout_path, style_path, asset_store, warm_up=True)
+    _worker_trace = trace
+
+
+def _render(params: Dict[str, Any], fmt: str) -> tuple:
+    """在工作进程中渲染，返回 (图片字节, 渲染耗时毫秒, 计时记录或 None)"""
+    start = time.perf_counter()
+    trace = RenderTrace(pid=os.getpid()) if _worker_trace else NULL_TRACE
+    data = cover_engine.worker_renderer().render_data(params, "bytes", fmt, trace=trace)
+    return data, (time.perf_counter() - start) * 1000, trace.to_dict()
+
+
+class ServiceState:
+    """进程池和服务统计"""
+
+    def __init__(self, workers: int, layout_path: str, style_path: str,
+                 max_queue: int = 64, latency_window: int = 1000, trace_path: Optional[str] = None,
+                 asset_store: Optional[str] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.started = time.time()
+        self.trace = bool(trace_path)
+        if asset_store:
+            cover_engine.prepare_asset_store(asset_store, layout_path, style_path)
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                         initargs=(layout_path, style_path, self.trace, asset_store))
+        self._trace_writer = TraceWriter(trace_path) if trace_path else None
+        self._traces = deque(maxlen=TRACE_WINDOW)
+        self.requests = 0
+        self.ok = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Optional[int]:
+        """占用一个队列位置，返回占用后的队列深度；队列已满时返回 None"""
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.max_queue:
+                self.rejected += 1
+                return None
+            self.in_flight += 1
+            return self.in_flight
+
+    def release(self, *_):
+        """释放一个队列位置（由进程池在任务结束时回调）"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def record(self, ok: bool, latency_ms: float, trace: Optional[Dict[str, Any]] = None):
+        """记录一次请求的结果"""
+        with self._lock:
+            if ok:
+                self.ok += 1
+                self._latencies.append(latency_ms)
+            else:
+                self.errors += 1
+            if trace:
+                self._traces.append(trace)
+        if trace and self._trace_writer:
+            self._trace_writer.write(trace)
+
+    def submit(self, params: Dict[str, Any], fmt: str) -> "multiprocessing.pool.AsyncResult":
+        """
+        把已占用队列位置的请求提交到进程池
+
+        位置在工作进程中的任务真正结束时才释放：等待超时的任务仍在运行，继续计入队列深度。
+        """
+        try:
+            return self.pool.apply_async(_render, (params, fmt),
+                                         callback=self.release, error_callback=self.release)
+        except BaseException:
+            self.release()
+            raise
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+            traces = list(self._traces)
+            metrics = {
+                "uptime": time.time() - self.started,
+                "workers": self.workers,
+                "requests": self.requests,
+                "ok": self.ok,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "queue_depth": self.in_flight,
+                "max_queue": self.max_queue,
+                "latency_ms": summarize(latencies),
+            }
+        if self.trace:
+            # 最近 TRACE_WINDOW 次渲染各阶段的耗时分位数
+            metrics["stages_ms"] = aggregate(traces)
+        return metrics
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        if self._trace_writer:
+            self._trace_writer.close()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "CoverServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> ServiceState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, Any]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, obj: Dict[str, Any], headers: Optional[Dict[str, Any]] = None):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "workers": self.state.workers})
+        elif path == "/metrics":
+            self._send_json(200, self.state.metrics())
+        else:
+            self._send_json(404, {"error": f"未知路径: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self._send_json(404, {"error": f"未知路径: {url.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": "请求体过大"})
+            return
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("请求体必须是JSON对象")
+            fmt = format_name(parse_qs(url.query).get("format", ["jpeg"])[0])
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        # 服务只返回图片字节，不写文件
+        params.pop("output_path", None)
+        params.pop("derivatives", None)
+
+        depth = self.state.acquire()
+        if depth is None:
+            self._send_json(503, {"error": "渲染队列已满"}, {"Retry-After": 1})
+            return
+
+        start = time.perf_counter()
+        ok = False
+        trace = None
+        try:
+            data, render_ms, trace = self.state.submit(params, fmt).get(RENDER_TIMEOUT)
+            ok = True
+        except multiprocessing.TimeoutError:
+            self._send_json(504, {"error": "渲染超时"})
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.state.record(ok, latency_ms, trace)
+
+        if ok:
+            self._send(200, data, CONTENT_TYPES.get(fmt, "application/octet-stream"), {
+                "X-Queue-Depth": depth,
+                "X-Render-Time-Ms": f"{render_ms:.1f}",
+                "X-Latency-Ms": f"{latency_ms:.1f}",
+            })
+
+
+class CoverServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: ServiceState, verbose: bool = False):
+        super().__init__(address, RenderHandler)
+        self.state = state
+        self.verbose = verbose
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: Optional[int] = None,
+          layout_path: Optional[str] = None, style_path: Optional[str] = None,
+          max_queue: int = 64, verbose: bool = False, trace_path: Optional[str] = None,
+          asset_store: Optional[str] = None):
+    """启动服务并阻塞，直到 Ctrl+C"""
+    state = ServiceState(workers or os.cpu_count() or 1,
+                         layout_path or cover_engine.LAYOUT_PATH,
+                         style_path or cover_engine.STYLE_PATH, max_queue, trace_path=trace_path,
+                         asset_store=asset_store)
+    server = CoverServer((host, port), state, verbose)
+    print(f"封面渲染服务已启动: http://{host}:{server.server_address[1]} ({state.workers} 个工作进程)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        state.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="本地封面渲染服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认 127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8765, help="端口（默认 8765）")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument("--max-queue", type=int, default=64, help="同时排队的请求数上限")
+    parser.add_argument("--layout", default=None, help="布局配置路径（默认 layout.json）")
+    parser.add_argument("--style", default=None, help="样式配置路径（默认 style.json）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出访问日志")
+    parser.add_argument("--trace", default=None,
+                        help="记录各阶段耗时并写入该JSONL文件，/metrics 中给出分阶段分位数")
+    parser.add_argument("--asset-store", default=None,
+                        help="素材库目录：预先解码模板素材，工作进程以内存映射方式共享")
+    args = parser.parse_args(argv)
+
+    serve(args.host, args.port, args.workers, args.layout, args.style, args.max_queue,
+          args.verbose, args.trace, args.asset_store)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+cover_shared.py - 进程池共享的模板像素
+
+父进程把模板的只读像素（解码后的背景、暗角蒙版、缩放到元素尺寸的装饰图片）放入一块
+multiprocessing.shared_memory，工作进程 attach() 后在其上建立 NumPy/PIL 视图并放入各缓存，
+不再各自解码和保存一份，工作进程数增加时常驻内存基本不变。
+字体仍按路径加载（FreeType 以内存映射方式读取字体文件，已经通过页缓存共享）。
+
+用法:
+    with SharedAssets(layout_path, style_path) as shared:
+        pool = multiprocessing.Pool(n, initializer=attach, initargs=(shared.spec,))
+"""
+import os
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+import cover_engine
+from cover_assets import load_element_bitmap, image_view, BITMAP_CACHE
+
+# 各数组在共享内存中的对齐字节数
+ALIGNMENT = 64
+
+# 工作进程中已连接的共享内存（保持引用，视图依赖它的缓冲区）
+_attached: Optional[shared_memory.SharedMemory] = None
+
+
+def _template_arrays(plan: "cover_engine.RenderPlan") -> List[tuple]:
+    """收集模板的只读像素，返回 [(种类, 键, 数组)]"""
+    arrays = []
+    st = os.stat(plan.bg_path)
+    background = cover_engine.load_background_array(plan.bg_path)
+    arrays.append(("background", (plan.bg_path, st.st_mtime_ns, st.st_size), background))
+
+    strength = float(plan.filters.get("vignette_strength", 0.0))
+    if plan.filters.get("enable", True) and strength > 0:
+        h, w = background.shape[:2]
+        arrays.append(("vignette", (w, h, strength), cover_engine.vignette_mask(w, h, strength)))
+
+    seen = set()
+    for elem in plan.elements:
+        if not isinstance(elem, cover_engine.ImageElement):
+            continue
+        size = (elem.box[2], elem.box[3])
+        if not all(isinstance(v, int) and v > 0 for v in size):
+            continue
+        for path in elem._pattern_files():
+            if (path, size) in seen:
+                continue
+            seen.add((path, size))
+            mtime_ns = os.stat(path).st_mtime_ns
+            try:
+                bitmap = load_element_bitmap(path, size)
+            except Exception:
+                # 无法解码的素材留给渲染时报告
+                continue
+            arrays.append(("bitmap", (path, size, mtime_ns), np.asarray(bitmap)))
+    return arrays
+
+
+class SharedAssets:
+    """
+    父进程中创建的共享像素块
+
+    spec 可传给工作进程（可pickle），close() 释放并删除共享内存；
+    应在所有工作进程结束后再关闭。
+    """
+
+    def __init__(self, layout_path: Optional[str] = None, style_path: Optional[str] = None):
+        plan = cover_engine.compile_template(cover_engine.load_json(layout_path or cover_engine.LAYOUT_PATH),
+                                             cover_engine.load_json(style_path or cover_engine.STYLE_PATH))
+        arrays = _template_arrays(plan)
+
+        entries = []
+        offset = 0
+        for kind, key, array in arrays:
+            entries.append((kind, key, offset, array.shape, array.dtype.str))
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        self.nbytes = offset
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (_, _, array), (_, _, start, shape, dtype) in zip(arrays, entries):
+            np.ndarray(shape, dtype, buffer=self._shm.buf, offset=start)[...] = array
+        self.spec: Dict[str, Any] = {"name": self._shm.name, "entries": entries}
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec: Dict[str, Any]) -> int:
+    """
+    在工作进程中连接共享内存，把其中的像素以只读视图放入背景、暗角和位图缓存
+
+    返回放入的条目数。视图在进程退出前一直有效；工作进程不负责删除共享内存。
+    """
+    global _attached
+    shm = shared_memory.SharedMemory(name=spec["name"])
+    for kind, key, offset, shape, dtype in spec["entries"]:
+        array = np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        array.flags.writeable = False
+        if kind == "background":
+            path, mtime_ns, size = key
+            cover_engine.BACKGROUND_CACHE.put(path, array, (mtime_ns, size))
+        elif kind == "vignette":
+            cover_engine.set_vignette_mask(*key, array)
+        elif kind == "bitmap":
+            path, size, mtime_ns = key
+            BITMAP_CACHE.put(path, size, image_view(array), mtime_ns)
+    _attached = shm
+    return len(spec["entries"])
@@ -0,0 +1,407 @@
+"""
+cover_trace.py - 渲染过程计时
+
+RenderTrace 记录一次渲染中每个阶段和每个元素的耗时（以及字号尝试、缓存命中等附加信息），
+可随结果返回或写成JSON行；未启用时使用 NULL_TRACE，各调用点几乎没有开销。
+aggregate() 把多次渲染的记录汇总为各阶段的 p50/p95/p99。
+MemoryTrace 另外用 tracemalloc 和RSS采样记录每个阶段的内存峰值和主要分配位置。
+count_frame_copy() / frame_copies() 统计整帧像素复制次数。
+"""
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, List, Optional, Callable
+
+
+class _Span:
+    __slots__ = ("trace", "record", "counters", "before", "start")
+
+    def __init__(self, trace: "RenderTrace", name: str, counters: Optional[Callable], attrs):
+        self.trace = trace
+        self.record = {"name": name}
+        self.record.update(attrs)
+        self.counters = counters
+        self.before = None
+
+    def __enter__(self):
+        if self.counters is not None:
+            self.before = self.counters()
+        self.trace._begin(self.record)
+        self.trace._stack().append(self.record)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        trace = self.trace
+        trace._stack().pop()
+        record = self.record
+        trace._end(record)
+        record["start_ms"] = round((self.start - trace.started) * 1000, 3)
+        record["duration_ms"] = round((end - self.start) * 1000, 3)
+        if self.counters is not None:
+            after = self.counters()
+            for key, value in after.items():
+                delta = value - self.before.get(key, 0)
+                if delta:
+                    record[key] = delta
+        with trace._lock:
+            trace.spans.append(record)
+        return False
+
+
+class RenderTrace:
+    """
+    单次渲染的计时记录
+
+    span(name, counters=None, **attrs) 返回上下文管理器，退出时记录起止时间；
+    counters 为返回计数字典的函数，记录进入和退出之间各计数的增量（如缓存命中数）。
+    note(**attrs) 把附加信息写入当前线程最内层的 span。
+    """
+    enabled = True
+
+    def __init__(self, **attrs):
+        self.attrs = attrs
+        self.spans: List[Dict[str, Any]] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, counters: Optional[Callable[[], Dict[str, int]]] = None, **attrs) -> _Span:
+        return _Span(self, name, counters, attrs)
+
+    def note(self, **attrs):
+        stack = self._stack()
+        if stack:
+            stack[-1].update(attrs)
+
+    def _begin(self, record: Dict[str, Any]):
+        """span 开始计时前调用，子类可在此采集额外数据"""
+
+    def _end(self, record: Dict[str, Any]):
+        """span 结束计时后调用"""
+
+    def finish(self, end: Optional[float] = None):
+        """结束记录，end 为结束时刻（time.perf_counter()，默认当前）"""
+        if self.finished is None:
+            self.finished = time.perf_counter() if end is None else end
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished if self.finished is not None else time.perf_counter()
+        result = dict(self.attrs)
+        result["total_ms"] = round((end - self.started) * 1000, 3)
+        with self._lock:
+            result["spans"] = sorted(self.spans, key=lambda s: s["start_ms"])
+        return result
+
+
+def current_rss() -> Optional[int]:
+    """当前进程的常驻内存（字节），无法读取时返回 None"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # 没有 /proc 时退回历史峰值（macOS 单位为字节，Linux 为KB）
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class RssSampler:
+    """后台线程定时读取RSS，记录自上次 take_peak() 以来的最大值"""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self._peak = current_rss() or 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cover-rss", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> int:
+        rss = current_rss() or 0
+        with self._lock:
+            if rss > self._peak:
+                self._peak = rss
+        return rss
+
+    def take_peak(self) -> int:
+        """返回并重置峰值（重置为当前值）"""
+        rss = current_rss() or 0
+        with self._lock:
+            peak = max(self._peak, rss)
+            self._peak = rss
+        return peak
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+# 正在使用 tracemalloc 的 MemoryTrace 数；第一个开始跟踪，最后一个结束时停止
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+_tracemalloc_lock = threading.Lock()
+
+
+def _acquire_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            # 调用方已自行开启的跟踪不由这里停止
+            _tracemalloc_owned = not tracemalloc.is_tracing()
+            if _tracemalloc_owned:
+                tracemalloc.start()
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+class MemoryTrace(RenderTrace):
+    """
+    带内存统计的渲染记录
+
+    每个 span 额外记录:
+        mem_peak_bytes: tracemalloc 统计的分配峰值（相对 span 开始时）
+        mem_delta_bytes: span 结束时仍未释放的分配量
+        rss_peak_bytes / rss_delta_bytes: 采样得到的RSS峰值及其相对开始时的增量
+        top_allocs: span 结束时净增最多的分配位置（只有 tracemalloc 能看到的分配，
+                    如NumPy数组；Pillow图像内存不经过 tracemalloc，体现在RSS中）
+    tracemalloc 和RSS都是进程级的，同一时间只应有一次渲染在记录（各 span 会重置全局峰值）；
+    多个记录同时存在时 tracemalloc 保持开启，直到最后一个 finish()。
+    """
+
+    def __init__(self, top: int = 5, rss_interval: float = 0.002, **attrs):
+        self.top = top
+        _acquire_tracemalloc()
+        tracemalloc.reset_peak()
+        self._rss = RssSampler(rss_interval)
+        self._mem_start = tracemalloc.get_traced_memory()[0]
+        self._rss_start = current_rss() or 0
+        self.mem_peak = 0
+        self.rss_peak = self._rss_start
+        # 正在进行的 span: id(record) -> [开始时内存, 期间峰值, 开始时RSS, RSS峰值, 快照]
+        self._open: Dict[int, list] = {}
+        super().__init__(**attrs)
+
+    def _absorb_peaks(self):
+        """把自上次重置以来的峰值计入所有未结束的 span，并重置峰值"""
+        _, peak = tracemalloc.get_traced_memory()
+        rss_peak = self._rss.take_peak()
+        tracemalloc.reset_peak()
+        self.mem_peak = max(self.mem_peak, peak)
+        self.rss_peak = max(self.rss_peak, rss_peak)
+        for state in self._open.values():
+            state[1] = max(state[1], peak)
+            state[3] = max(state[3], rss_peak)
+
+    def _snapshot(self):
+        # 排除 tracemalloc 和本模块自身的分配（快照对象等）
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _begin(self, record):
+        snapshot = self._snapshot() if self.top else None
+        self._absorb_peaks()
+        current = tracemalloc.get_traced_memory()[0]
+        rss = current_rss() or 0
+        self._open[id(record)] = [current, current, rss, rss, snapshot]
+
+    def _end(self, record):
+        self._absorb_peaks()
+        start, peak, rss_start, rss_peak, before = self._open.pop(id(record))
+        current = tracemalloc.get_traced_memory()[0]
+        record["mem_peak_bytes"] = peak - start
+        record["mem_delta_bytes"] = current - start
+        record["rss_peak_bytes"] = rss_peak
+        record["rss_delta_bytes"] = rss_peak - rss_start
+        if before is not None:
+            after = self._snapshot()
+            stats = [stat for stat in after.compare_to(before, "lineno") if stat.size_diff > 0]
+            record["top_allocs"] = [
+                {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "size_bytes": stat.size_diff, "count": stat.count_diff}
+                for stat in stats[:self.top]]
+
+    def finish(self, end: Optional[float] = None):
+        if self.finished is not None:
+            return
+        super().finish(end)
+        self._absorb_peaks()
+        self._rss.stop()
+        _release_tracemalloc()
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = super().to_dict()
+        result["mem_peak_bytes"] = self.mem_peak - self._mem_start
+        result["rss_peak_bytes"] = self.rss_peak
+        result["rss_delta_bytes"] = self.rss_peak - self._rss_start
+        return result
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _NullTrace:
+    """未启用时的占位记录，所有方法都不做任何事"""
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name, counters=None, **attrs):
+        return self._span
+
+    def note(self, **attrs):
+        pass
+
+    def finish(self, end=None):
+        pass
+
+    def to_dict(self):
+        return None
+
+
+NULL_TRACE = _NullTrace()
+
+# 进程内整帧像素复制的累计次数（背景复制、格式转换等），基准测试据此统计每次渲染的复制数
+_frame_copies = 0
+
+
+def count_frame_copy(n: int = 1):
+    """在发生 n 次整帧复制的位置调用（不加锁，多线程下只作近似统计）"""
+    global _frame_copies
+    _frame_copies += n
+
+
+def frame_copies() -> int:
+    """返回进程内整帧复制的累计次数"""
+    return _frame_copies
+
+
+_current_trace = contextvars.ContextVar("cover_trace", default=NULL_TRACE)
+
+
+def current_trace():
+    """返回当前上下文中启用的记录（未启用时为 NULL_TRACE）"""
+    return _current_trace.get()
+
+
+@contextmanager
+def activate(trace):
+    """在 with 块内把 trace 设为当前记录，供深层函数（如字号拟合）写入附加信息"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序列表的分位数（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(values: Iterable[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def aggregate(traces: Iterable[Optional[Dict[str, Any]]], field: str = "duration_ms",
+              total_field: str = "total_ms") -> Dict[str, Dict[str, float]]:
+    """
+    汇总多次渲染的记录，返回 {阶段名: {count, p50, p95, p99, max}}
+
+    默认统计耗时（毫秒）：同一次渲染中同名的 span（如多个输出的编码）相加后计入一次，
+    "total" 为整次渲染耗时。field 为 "mem_peak_bytes" 等内存字段时同名 span 取最大值。
+    """
+    combine = (lambda a, b: a + b) if field == "duration_ms" else max
+    values_by_name: Dict[str, List[float]] = {}
+    for trace in traces:
+        if not trace:
+            continue
+        per_render: Dict[str, float] = {}
+        if total_field in trace:
+            per_render["total"] = trace[total_field]
+        for span in trace["spans"]:
+            if field not in span:
+                continue
+            name = span["name"]
+            per_render[name] = combine(per_render[name], span[field]) if name in per_render else span[field]
+        for name, value in per_render.items():
+            values_by_name.setdefault(name, []).append(value)
+    return {name: summarize(values) for name, values in values_by_name.items()}
+
+
+def format_summary(summary: Dict[str, Dict[str, float]], scale: float = 1.0) -> str:
+    """把 aggregate() 的结果格式化为文本表格，数值除以 scale（如 2**20 显示为MiB）"""
+    lines = [f"{'阶段':<30} {'次数':>6} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+    for name, row in sorted(summary.items(), key=lambda item: -item[1]["p50"]):
+        lines.append(f"{name:<32} {row['count']:>6} {row['p50'] / scale:>10.2f} "
+                     f"{row['p95'] / scale:>10.2f} {row['p99'] / scale:>10.2f} {row['max'] / scale:>10.2f}")
+    return "\n".join(lines)
+
+
+class TraceWriter:
+    """把渲染记录逐行写为JSON（线程安全）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, trace: Optional[Dict[str, Any]], **extra):
+        if not trace:
+            return
+        record = dict(extra)
+        record.update(trace)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
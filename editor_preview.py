@@ -3,9 +3,6 @@ editor_preview.py - 封面预览功能
 """
 import os
 import sys
-import json
-import tempfile
-import shutil
 from PyQt5 import QtWidgets, QtCore, QtGui
 
 
@@ -19,19 +16,6 @@ def show_preview(parent, layout_cfg, style_cfg):
         style_cfg: 样式配置
     """
     try:
-        # 创建临时目录
-        temp_dir = tempfile.mkdtemp(prefix="cover_preview_")
-        
-        # 保存临时配置
-        temp_layout_path = os.path.join(temp_dir, "layout.json")
-        temp_style_path = os.path.join(temp_dir, "style.json")
-        
-        with open(temp_layout_path, "w", encoding="utf-8") as f:
-            json.dump(layout_cfg, f, ensure_ascii=False, indent=2)
-        
-        with open(temp_style_path, "w", encoding="utf-8") as f:
-            json.dump(style_cfg, f, ensure_ascii=False, indent=2)
-        
         # 构造示例参数
         params = {
             "title": "示例标题",
@@ -66,38 +50,14 @@ def show_preview(parent, layout_cfg, style_cfg):
                     # 图片元素 - 留空，使用默认图片模式
                     pass
         
-        # 设置输出路径
-        temp_output_path = os.path.join(temp_dir, "preview.png")
-        params["output_path"] = temp_output_path
-        
-        # 临时修改cover_engine的配置路径
+        # 直接使用编辑中的配置在内存中渲染，不写临时文件
         import cover_engine
-        original_layout_path = cover_engine.LAYOUT_PATH
-        original_style_path = cover_engine.STYLE_PATH
-        
-        try:
-            # 临时替换配置路径
-            cover_engine.LAYOUT_PATH = temp_layout_path
-            cover_engine.STYLE_PATH = temp_style_path
-            
-            # 渲染封面
-            output_path = cover_engine.render_cover(params)
-            
-            # 创建预览对话框
-            dialog = PreviewDialog(parent, output_path, temp_dir)
-            dialog.exec_()
-            
-        finally:
-            # 恢复原始路径
-            cover_engine.LAYOUT_PATH = original_layout_path
-            cover_engine.STYLE_PATH = original_style_path
-            
-            # 清理临时目录（如果对话框没有保存图片）
-            if not dialog.saved:
-                try:
-                    shutil.rmtree(temp_dir)
-                except:
-                    pass
+        image_data = cover_engine.render_cover_data(params, "bytes", "PNG",
+                                                    layout=layout_cfg, style=style_cfg)
+        
+        # 创建预览对话框
+        dialog = PreviewDialog(parent, image_data)
+        dialog.exec_()
     
     except Exception as e:
         QtWidgets.QMessageBox.critical(parent, "预览错误", f"生成预览失败: {str(e)}")
@@ -106,11 +66,9 @@ def show_preview(parent, layout_cfg, style_cfg):
 class PreviewDialog(QtWidgets.QDialog):
     """预览对话框"""
     
-    def __init__(self, parent, image_path, temp_dir):
+    def __init__(self, parent, image_data):
         super().__init__(parent)
-        self.image_path = image_path
-        self.temp_dir = temp_dir
-        self.saved = False
+        self.image_data = image_data
         
         self.setWindowTitle("封面预览")
         self.setModal(True)
@@ -160,9 +118,9 @@ class PreviewDialog(QtWidgets.QDialog):
     
     def load_preview_image(self):
         """加载预览图片"""
-        if os.path.exists(self.image_path):
-            pixmap = QtGui.QPixmap(self.image_path)
-            if not pixmap.isNull():
+        if self.image_data:
+            pixmap = QtGui.QPixmap()
+            if pixmap.loadFromData(self.image_data, "PNG"):
                 # 缩放以适应窗口
                 scaled_pixmap = pixmap.scaled(
                     self.image_label.size() * 0.9, 
@@ -183,7 +141,7 @@ class PreviewDialog(QtWidgets.QDialog):
     
     def save_image(self):
         """保存图片"""
-        if not os.path.exists(self.image_path):
+        if not self.image_data:
             QtWidgets.QMessageBox.warning(self, "保存失败", "预览图片不存在")
             return
         
@@ -196,23 +154,10 @@ class PreviewDialog(QtWidgets.QDialog):
         
         if file_path:
             try:
-                # 复制图片到指定位置
-                import shutil
-                shutil.copy2(self.image_path, file_path)
+                # 写出预览图片数据
+                with open(file_path, "wb") as f:
+                    f.write(self.image_data)
                 
                 QtWidgets.QMessageBox.information(self, "保存成功", f"图片已保存到:\n{file_path}")
-                self.saved = True
             except Exception as e:
                 QtWidgets.QMessageBox.critical(self, "保存失败", f"保存图片时出错:\n{str(e)}")
-    
-    def closeEvent(self, event):
-        """关闭事件"""
-        # 清理临时目录
-        if not self.saved and os.path.exists(self.temp_dir):
-            try:
-                import shutil
-                shutil.rmtree(self.temp_dir)
-            except:
-                pass
-        
-        super().closeEvent(event)
\ No newline at end of file
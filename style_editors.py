@@ -7,6 +7,8 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QColor
 
+from cover_assets import find_assets, asset_info
+
 
 def create_image_style_editor(elem_id, style_cfg, on_changed_callback, base_dir=None):
     """创建图片元素的样式编辑器"""
@@ -53,13 +55,19 @@ def create_image_style_editor(elem_id, style_cfg, on_changed_callback, base_dir=
     preview_label.setAlignment(Qt.AlignCenter)
 
     def update_preview():
-        """更新图片预览"""
-        if style_cfg["image_pattern"] and os.path.exists(style_cfg["image_pattern"]):
-            preview_label.setText("")
+        """更新图片预览：显示匹配到的图片数量和首张图片尺寸"""
+        matches = find_assets(style_cfg["image_pattern"], base_dir) if style_cfg["image_pattern"] else []
+        if matches:
+            info = asset_info(matches[0])
+            text = f"{len(matches)} 张图片"
+            if info:
+                text += f"\n{info['width']}x{info['height']}"
+            preview_label.setText(text)
             preview_label.setStyleSheet("""
                 QLabel {
                     border: 1px solid #cccccc;
                     background-color: white;
+                    font-size: 10px;
                 }
             """)
         else: